@@ -162,9 +162,12 @@ class BaseDriver:
         block, header = IEEE_488_2_BinBlock(values, datatype, is_big_endian)
         log_msg = message+header+'<DATABLOCK>'
         log.debug("%s << %s", str(self.ins), log_msg)
+        termination = self.ins.write_termination if termination is None else termination
+        encoding = self.ins.encoding if encoding is None else encoding
         try:
-            ret = self.ins.write_binary_values(message, values, datatype,
-                                               is_big_endian, termination, encoding)
+            # 直接发送已打包好的二进制块，避免pyvisa再逐点打包一次
+            ret = self.ins.write_raw(message.encode(encoding)+block
+                                     +termination.encode(encoding))
         except:
             log.exception("%s << %s", str(self.ins), log_msg)
             raise
@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-
-import struct
 import numpy as np
 
 def IEEE_488_2_BinBlock(datalist, dtype="int16", is_big_endian=True):
@@ -23,14 +22,54 @@ def IEEE_488_2_BinBlock(datalist, dtype="int16", is_big_endian=True):
              "float"  : (float, 'f'), "double" : (float, 'd'),
              "float32": (float, 'f'), "float64": (float, 'd')}
 
-    datalist = np.asarray(datalist)
-    datalist.astype(types[dtype][0])
-    if is_big_endian:
-        endianc = '>'
-    else:
-        endianc = '<'
-    datablock = struct.pack('%s%d%s' % (endianc, len(datalist), types[dtype][1]), *datalist)
+    datablock = DAC_bytes(datalist, types[dtype][1], is_big_endian)
     size = '%d' % len(datablock)
     header = '#%d%s' % (len(size),size)
 
     return header.encode()+datablock, header
+
+
+def DAC_codes(data, scale, zero=0, gain=1, offset=0, bits=16, unsigned=False,
+              low=None, high=None):
+    """将波形电压转换为DAC码值
+
+    data     : 波形数据，可以是数组或Wavedata(取其data)
+    scale    : 单位电压对应的码值
+    zero     : 0电平码值
+    gain     : 通道增益系数
+    offset   : 偏置电压
+    bits     : DAC位数，决定码值范围和输出类型
+    unsigned : 是否为无符号码值
+    low,high : 码值范围，默认由bits和unsigned决定
+
+    码值 = 截断取整((data*gain+offset)*scale)+zero，超出范围的码值被限幅，
+    全程在一个缓冲区上原地计算，返回 uint16/int16 等整数数组
+    """
+    data = np.asarray(getattr(data, 'data', data))
+    if unsigned:
+        lo, hi = 0, (1 << bits)-1
+    else:
+        lo, hi = -(1 << (bits-1)), (1 << (bits-1))-1
+    lo = lo if low is None else low
+    hi = hi if high is None else high
+    y = np.multiply(np.real(data), gain, dtype=float)
+    if offset:
+        y += offset
+    y *= scale
+    np.trunc(y, out=y)
+    if zero:
+        y += zero
+    np.clip(y, lo, hi, out=y)
+    nbytes = next(n for n in (1, 2, 4, 8) if 8*n >= bits)
+    return y.astype('%s%d' % ('u' if unsigned else 'i', nbytes))
+
+
+def DAC_bytes(codes, dtype="h", is_big_endian=False):
+    """将码值数组按给定类型和字节序转换为连续的字节流，不经过Python层逐点打包
+
+    codes : 码值数组
+    dtype : struct格式字符，如 'h', 'H', 'f'
+    """
+    endianc = '>' if is_big_endian else '<'
+    codes = np.asarray(codes)
+    return codes.astype(endianc+dtype, copy=False).tobytes()
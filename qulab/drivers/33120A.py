@@ -3,6 +3,7 @@ import time
 
 import numpy as np
 from qulab.device import BaseDriver, QInteger, QOption, QReal, QString, QVector
+from qulab.device.util import DAC_codes
 
 
 # yapf: disable
@@ -69,10 +70,9 @@ class Driver(BaseDriver):
 
     def update_waveform(self, values, name='ABS'):
         if self.model == '33120A':
-            clip = lambda x: (2047*x).clip(-2047,2047).astype(int)
+            values = DAC_codes(values, 2047, bits=12, low=-2047)
         elif self.model == '33220A':
-            clip = lambda x: (8191*x).clip(-8191,8191).astype(int)
-        values = clip(values)
+            values = DAC_codes(values, 8191, bits=14, low=-8191)
         self.write_binary_values('DATA:DAC VOLATILE,', values,
                                  datatype='h', is_big_endian=True)
         if len(name) > 8:
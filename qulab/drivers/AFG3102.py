@@ -4,6 +4,7 @@ import time
 import numpy as np
 
 from qulab.device import BaseDriver, QInteger, QOption, QReal, QString, QVector
+from qulab.device.util import DAC_codes
 
 
 class Driver(BaseDriver):
@@ -60,22 +61,15 @@ class Driver(BaseDriver):
     #在创建好的波形文件中，写入或者更新具体波形
     def upwave(self,points,ch=1,T0=100):
         pointslen=len(points)
-        pointslen2=2*pointslen
         #写入波形数据
         self.write('DATA:DEFine EMEMory,%d' %pointslen)
         self.write('DATA:POINts EMEMory, %d' %pointslen)
         message=':DATA:DATA EMEMory,'# % (len(str(pointslen2)),pointslen2)
-        points = points.clip(-1,1)
-        values=np.zeros(pointslen).astype(np.uint16)
-        #乘积选用8191是为了防止最终值大于16383
-        values = (points * 8191).astype(np.uint16)+8192 #.astype(np.uint16)
-        byte=np.zeros(pointslen2).astype(np.uint8)
-        #将原先的两比特数据点，分割为高低两个比特
-        byte[1:pointslen2:2]=(values & 0b11111111).astype(np.uint8)
-        byte[0:pointslen2:2]=((values & 0b11111100000000) >> 8).astype(np.uint8)
-        #write_binary_value中的message参数不要包括#42048的信息，因为pyvisa可以自动算出结果。详见pyvisa中util.py内的to_binary_block
-        #AFG3102选用big_endian。这表示程序按照我给的顺序将二进制包写进去
-        self.write_binary_values(message, byte, datatype='B',is_big_endian=False,termination=None, encoding=None)
+        #乘积选用8191是为了防止最终值大于16383，码值为14位无符号数
+        values = DAC_codes(points, 8191, 8192, bits=14, unsigned=True, low=1)
+        #write_binary_value中的message参数不要包括#42048的信息，会自动算出结果
+        #AFG3102选用big_endian，每个码值按2字节整体打包
+        self.write_binary_values(message, values, datatype='H',is_big_endian=True,termination=None, encoding=None)
         # self.write('enable' )
         self.write('TRAC:COPY USER%d,EMEM' %ch)
         self.write('SOURce%d:FUNCTION USER%d' %(ch,ch))
@@ -10,6 +10,7 @@ import time
 
 import numpy as np
 
+from qulab.device.util import DAC_codes, DAC_bytes
 from . import AWGBoardDefines
 from . import mf_board as RAWBoard
 import struct
@@ -426,12 +427,7 @@ class AWGBoard(RAWBoard.board):
         :notes::
             输入的数据是无符号short类型数据，转换成网络接口接受的字节流
         """
-        if unsigned:
-            fmt = "{0:d}H".format(len(data))
-        else:
-            fmt = "{0:d}h".format(len(data))
-        packet = struct.pack(fmt, *data)
-        return packet
+        return DAC_bytes(data, 'H' if unsigned else 'h')
 
     def _WriteWaveCommands(self, channel, commands):
         """
@@ -469,17 +465,19 @@ class AWGBoard(RAWBoard.board):
         """
 
         self._channel_check(channel)
+        wave = np.asarray(wave)
         if self.wave_is_unsigned:
-            assert max(wave) < 65536  # 码值异常，大于上限
-            assert min(wave) >= 0  # 码值异常，小于下限
+            assert wave.max() < 65536  # 码值异常，大于上限
+            assert wave.min() >= 0  # 码值异常，小于下限
         else:
-            assert max(wave) < 32769, max(wave)  # 码值异常，大于上限
-            assert min(wave) > -32769, min(wave)  # 码值异常，小于下限
+            assert wave.max() < 32769, wave.max()  # 码值异常，大于上限
+            assert wave.min() > -32769, wave.min()  # 码值异常，小于下限
         self._AWGChannelSelect(channel, 1)  # 1表示波形数据
         startaddr = 0  # 波形数据的内存起始地址，单位是字节。
         pkt_unit = 512
         pad_cnt = (pkt_unit - len(wave) & (pkt_unit-1)) & (pkt_unit-1)
-        temp_wave = wave + [self.zerocode[channel - 1]] * pad_cnt
+        temp_wave = np.pad(wave, (0, pad_cnt), mode='constant',
+                           constant_values=self.zerocode[channel - 1])
 
         packet = self._format_data(temp_wave, self.wave_is_unsigned)
         # _bank = self.bank_dic['awg'][channel - 1]
@@ -767,6 +765,23 @@ class AWGBoard(RAWBoard.board):
         volts = (20.48 + ((code - (sign << 9)) * 13.1) / 1024) * 0.05
         return volts
 
+    def _wave_codes(self, channel, wave_data, mark=None):
+        """
+        电压到码值的转换，为了给偏置留余量，要求最大输出电压比给用户的电压多10%，
+        对于vpp为2V的AWG，其最大电压输出其实能到2.2V；
+        mark不为None时，码值最低位为mark标识
+        :return: uint16或int16码值数组
+        """
+        volt_factor = self.coe[channel - 1]  # self.voltrange[channel - 1][1] - self.voltrange[channel - 1][0]
+        gain = self.channel_gain[channel - 1] / volt_factor
+        _volt_offset = 1 if self.wave_is_unsigned else 0
+        if mark is None:
+            return DAC_codes(wave_data, 32767.5, gain=gain, offset=_volt_offset,
+                             unsigned=self.wave_is_unsigned)
+        codes = DAC_codes(wave_data, 32767.5/2, gain=gain, offset=_volt_offset,
+                          bits=15, unsigned=self.wave_is_unsigned)
+        return (codes * 2 + np.asarray(mark)).astype(codes.dtype)
+
     def gen_wave_unit(self, wave_data, wave_type='延时', start_time=0, mark=None):
         """[summary]
 
@@ -825,38 +840,19 @@ class AWGBoard(RAWBoard.board):
         type_list = []
         start_time_list = []
 
-        volt_factor = self.coe[channel - 1]  # self.voltrange[channel - 1][1] - self.voltrange[channel - 1][0]
         addr_step = int(np.log2(self.sample_per_clock))
-        if self.wave_is_unsigned :
-            _volt_offset = 1
-        else:
-            _volt_offset = 0
+        zerocode = self.zerocode[channel - 1]
         for item in waves_list:
-            # 电压到码值的转换，为了给偏置留余量，要求最大输出电压比给用户的电压多10%，对于vpp为2V的AWG，其最大电压输出其实能到2.2V
-            a1 = np.asarray(item['wave_data'])
-            a1 = a1.astype(np.float) * self.channel_gain[channel - 1]
-            # print(a1)
-            a1 = a1 / volt_factor
-
-            if self.mark_is_in_wave:
-                a1 = (a1 + _volt_offset) * 32767.5/2
-                b1 = a1.astype(np.uint16) * 2
-                c1 = b1 + np.asarray(item['mark'])
-                a1 = c1
-            else:
-                a1 = (a1 + _volt_offset) * 32767.5
-
-            if self.wave_is_unsigned :
-                trans_wave = list(a1.astype(np.uint16))
-            else:
-                trans_wave = list(a1.astype(np.int16))
+            mark = item['mark'] if self.mark_is_in_wave else None
+            trans_wave = self._wave_codes(channel, item['wave_data'], mark)
 
             wave_list.append(trans_wave)
             type_list.append(item['wave_type'])
             start_time_list.append(item['start_time'])
 
         cur_sample_point = 0
-        wave = []
+        wave = []  # 各段码值数组，最后一次拼接
+        wave_len = 0
         command = []
         for idx, wave_type in enumerate(type_list):
             if wave_type in ['触发','trig'] :
@@ -883,15 +879,14 @@ class AWGBoard(RAWBoard.board):
             # 计算延时计数器的值
             delay_cnt = delta_cnt >> addr_step
             # 如果起始时间与计数器不对齐，通过波形点前面补齐
-            pad_cnt = delta_cnt & (self.sample_per_clock-1)
-            temp_wave = [self.zerocode[channel - 1]] * pad_cnt
-            temp_wave = temp_wave + wave_list[idx]
+            pad_pre = delta_cnt & (self.sample_per_clock-1)
             # 如果补齐后的结束时间与时钟周期不对齐，通过波形点后面补齐
-            pad_cnt = (self.sample_per_clock - len(temp_wave) & (self.sample_per_clock-1)) & (self.sample_per_clock-1)
-            temp_wave = temp_wave + [self.zerocode[channel - 1]] * pad_cnt
+            pad_cnt = (self.sample_per_clock - (pad_pre + len(wave_list[idx])) & (self.sample_per_clock-1)) & (self.sample_per_clock-1)
+            temp_wave = np.pad(wave_list[idx], (pad_pre, pad_cnt), mode='constant',
+                               constant_values=zerocode)
 
             # 生成起始地址，波形长度
-            start_addr = len(wave) >> addr_step
+            start_addr = wave_len >> addr_step
             length = (len(temp_wave) >> addr_step)
             # 生成对应的命令
             # print(start_addr, length)
@@ -901,14 +896,16 @@ class AWGBoard(RAWBoard.board):
 
             # 拼接命令集与波形集
             command = command + temp_cmd
-            wave = wave + temp_wave
+            wave.append(temp_wave)
+            wave_len += len(temp_wave)
             cur_sample_point += (delay_cnt << addr_step) + len(temp_wave)
 
+        wave = np.concatenate(wave)
         # 最后一条命令要带停止标识，标识是最后一条命令
         if false_data:
-            self.waves[channel - 1] = [i for i in range(len(wave))]
+            self.waves[channel - 1] = np.arange(len(wave))
         else:
-            self.waves[channel - 1] = list(wave)
+            self.waves[channel - 1] = wave
 
         if len(command) == 4 and not is_continue:
             self.commands[channel - 1] = command * self.max_cmd_cnt
@@ -940,31 +937,15 @@ class AWGBoard(RAWBoard.board):
         self._channel_check(channel)
         pad_cnt = (512-(len(wave)&511)) & 511
         wave = np.pad(wave, (0,pad_cnt), mode='constant')
-        volt_factor = self.coe[channel - 1]  # self.voltrange[channel - 1][1] - self.voltrange[channel - 1][0]
-        if self.wave_is_unsigned :
-            _volt_offset = 1
-        else:
-            _volt_offset = 0
-        a1 = wave * self.channel_gain[channel - 1]
-        a1 = a1 / volt_factor
-        # a1 = (a1 + _volt_offset) * 32767.5
         if self.mark_is_in_wave and mark is not None:
             assert len(mark) == len(wave)
-            a1 = (a1 + _volt_offset) * 32767.5/2
-            b1 = a1.astype(np.uint16) * 2
-            c1 = b1 + mark
-            a1 = c1
-        else:
-            a1 = (a1 + _volt_offset) * 32767.5
-        
-        if self.wave_is_unsigned :
-            wave_data = a1.astype(np.uint16)
         else:
-            wave_data = a1.astype(np.int16)
-        
+            mark = None
+        wave_data = self._wave_codes(channel, wave, mark)
+
         # print(f'wave write to ddr: {hex(_start_addr)}')
         # 将编译的波形上传到DDR
-        self.write_ddr(start_addr=_start_addr, data=wave_data.tobytes())
+        self.write_ddr(start_addr=_start_addr, data=self._format_data(wave_data, self.wave_is_unsigned))
         # next addr 计算不能加上base addr
         next_addr = start_addr + (len(wave_data) << 1)
         return next_addr, wave_size
@@ -1,4 +1,5 @@
 import os
+import queue
 import time
 from contextlib import contextmanager
 from ctypes import (CDLL, POINTER, Structure, byref, c_char_p, c_float, c_int,
@@ -476,6 +477,23 @@ class DMABufferArray:
         self.__index = 0
 
 
+class RawRing:
+    def __init__(self, dtype, size, depth):
+        """
+        Bounded ring of raw DMA buffers shared between threads.
+
+        dtype: np.uint8 | np.uint16
+        size: samples per buffer
+        depth: number of slots, the acquisition thread blocks when all
+               slots are waiting to be processed
+        """
+        self.data = np.empty((depth, size), dtype)
+        self.free = queue.Queue()
+        self.full = queue.Queue()
+        for slot in range(depth):
+            self.free.put(slot)
+
+
 class AutoDMA:
     def __init__(self,
                  dig,
@@ -483,8 +501,12 @@ class AutoDMA:
                  repeats=0,
                  buffers=None,
                  recordsPerBuffer=1,
-                 timeout=1):
+                 timeout=1,
+                 dtype=np.float64):
         self.dig = dig
+        self.dtype = dtype
+        self._lut = None
+        self._channels = None
         self.samplesPerRecord = samplesPerRecord
         self.recordsPerBuffer = recordsPerBuffer
         self.repeats = repeats
@@ -522,23 +544,94 @@ class AutoDMA:
         self.dig.abortAsyncRead()
 
     def read(self):
+        """
+        Yield (chA, chB) in volts for each buffer. The same pair of channel
+        buffers is refilled for every DMA buffer, copy them to keep the data.
+        """
+        _read = self._read if self.buffers is None else self._readIntoBuffer
+
+        for data in _read():
+            yield self.convert(data)
+
+    def channels(self):
+        """Allocate a pair of channel buffers for convert()."""
+        size = self.samplesPerRecord * self.recordsPerBuffer
+        return np.empty(size, self.dtype), np.empty(size, self.dtype)
+
+    def _scales(self):
         codeZero = (1 << (self.dig.bitsPerSample - 1)) - 0.5
         codeRange = (1 << (self.dig.bitsPerSample - 1)) - 0.5
         scaleA = self.dig.inputRange[API.CHANNEL_A] / codeRange
         scaleB = self.dig.inputRange[API.CHANNEL_B] / codeRange
+        return codeZero, scaleA, scaleB
+
+    def _lookup(self):
+        """Code-to-volt lookup tables of both channels for 8-bit samples."""
+        if self._lut is None:
+            codeZero, scaleA, scaleB = self._scales()
+            code = np.arange(256) - codeZero
+            self._lut = ((scaleA * code).astype(self.dtype),
+                         (scaleB * code).astype(self.dtype))
+        return self._lut
+
+    def convert(self, data, out=None):
+        """
+        De-interleave raw codes of one buffer and convert them into volts,
+        writing into out=(chA, chB) or the buffers kept by this AutoDMA.
+        8-bit samples go through a lookup table, wider samples through
+        in-place subtract/multiply, no temporary arrays are allocated.
+        """
+        if out is None:
+            if self._channels is None:
+                self._channels = self.channels()
+            out = self._channels
+        chA, chB = out
+        if data.dtype == np.uint8:
+            lutA, lutB = self._lookup()
+            np.take(lutA, data[0::2], out=chA, mode='clip')
+            np.take(lutB, data[1::2], out=chB, mode='clip')
+        else:
+            codeZero, scaleA, scaleB = self._scales()
+            np.subtract(data[0::2], codeZero, out=chA)
+            np.subtract(data[1::2], codeZero, out=chB)
+            chA *= scaleA
+            chB *= scaleB
+        return chA, chB
+
+    def _bufferShape(self):
+        channelCount = 2
+        bytesPerSample = (self.dig.bitsPerSample + 7) // 8
+        samplesPerBuffer = self.samplesPerRecord * self.recordsPerBuffer * channelCount
+        return bytesPerSample, samplesPerBuffer
 
-        _read = self._read if self.buffers is None else self._readIntoBuffer
+    def ring(self, depth=16):
+        """Allocate a RawRing matching the buffer size of this acquisition."""
+        bytesPerSample, samplesPerBuffer = self._bufferShape()
+        dtype = np.uint8 if bytesPerSample == 1 else np.uint16
+        return RawRing(dtype, samplesPerBuffer, depth)
 
-        for data in _read():
-            data = data - codeZero
-            chA = scaleA * data[0::2]
-            chB = scaleB * data[1::2]
-            yield chA, chB
+    def readIntoRing(self, ring):
+        """
+        Copy each completed DMA buffer straight into a free slot of ring and
+        yield the slot number. Waits for a free slot when the ring is full.
+        Only for ADMA_ALLOC_BUFFERS mode (buffers is None).
+        """
+        assert self.buffers is None
+        bytesPerBuffer = ring.data[0].nbytes
+        count = 0
+        while True:
+            slot = ring.free.get()
+            self.dig.waitNextAsyncBufferComplete(ring.data[slot].ctypes.data,
+                                                 bytesPerBuffer,
+                                                 int(1000 * self.timeout))
+            self.dig.checkErrors()
+            yield slot
+            count += self.recordsPerBuffer
+            if count>=self.repeats and self.repeats>0:
+                break
 
     def _read(self):
-        channelCount = 2
-        bytesPerSample = (self.dig.bitsPerSample + 7) // 8
-        samplesPerBuffer = self.samplesPerRecord * self.recordsPerBuffer * channelCount
+        bytesPerSample, samplesPerBuffer = self._bufferShape()
         bytesPerBuffer = bytesPerSample * samplesPerBuffer
 
         dtype = c_uint8 if bytesPerSample == 1 else c_uint16
@@ -1,5 +1,11 @@
+import hashlib
 import logging
+import threading
 import time
+from collections import OrderedDict
+from fractions import Fraction
+from functools import reduce
+from math import gcd
 
 import numpy as np
 import re
@@ -30,6 +36,148 @@ def getExpArray(f_list, numOfPoints, weight=None, sampleRate=1e9):
     return np.asarray(e).T
 
 
+# 解调矩阵缓存，键为 (f_list, 点数, weight, 采样率, 类型, 缩放)，值为只读数组
+_kernels = OrderedDict()
+_kernels_lock = threading.Lock()
+_kernels_maxsize = 32
+
+
+def _weightKey(weight):
+    if weight is None:
+        return None
+    weight = np.ascontiguousarray(weight)
+    return weight.dtype.str + hashlib.sha1(weight.tobytes()).hexdigest()
+
+
+def getDemodKernel(f_list, numOfPoints, weight=None, sampleRate=1e9,
+                   dtype=np.complex128, scale=1):
+    '''缓存的解调矩阵 getExpArray(...)*scale，类型为dtype(complex128或complex64)；
+    参数相同时直接返回缓存的只读数组，扫描中切换读出配置不再重新计算'''
+    dtype = np.dtype(dtype)
+    key = (tuple(float(f) for f in f_list), int(numOfPoints), _weightKey(weight),
+           float(sampleRate), dtype.str, scale)
+    with _kernels_lock:
+        if key in _kernels:
+            _kernels.move_to_end(key)
+            return _kernels[key]
+    e = np.ascontiguousarray(
+        getExpArray(f_list, numOfPoints, weight, sampleRate) * scale, dtype)
+    e.setflags(write=False)
+    with _kernels_lock:
+        _kernels[key] = e
+        while len(_kernels) > _kernels_maxsize:
+            _kernels.popitem(last=False)
+    return e
+
+
+def clearDemodKernels():
+    with _kernels_lock:
+        _kernels.clear()
+
+
+def getFFTBins(f_list, numOfPoints, sampleRate=1e9):
+    '''f_list全部落在某个FFT长度N(不小于numOfPoints，不大于其4倍)的频率格点上时，
+    返回 (N, 各频率对应的格点序号)，否则返回None；
+    记录末尾补0到N点后做FFT，取这些格点即与解调矩阵的结果严格相同'''
+    fr = [Fraction(f / sampleRate).limit_denominator(4 * numOfPoints)
+          for f in f_list]
+    if any(abs(float(r) - f / sampleRate) > 1e-12 for r, f in zip(fr, f_list)):
+        return None
+    N0 = reduce(lambda a, b: a * b // gcd(a, b), [r.denominator for r in fr], 1)
+    N = -(-numOfPoints // N0) * N0
+    if N > 4 * numOfPoints:
+        return None
+    return N, np.array([int(r * N) % N for r in fr])
+
+
+class Accumulator(object):
+    '''逐块累加每个点的和，可选平方和与直方图，内存与累加的记录数无关；
+    可在多个线程中调用add，采集过程中可随时读取部分平均；
+    累加始终用双精度，dtype为返回的平均值、方差的精度(np.float32时为float32/complex64)'''
+
+    def __init__(self, size, iscomplex=False, var=False, bins=None, lim=1.0,
+                 dtype=np.float64):
+        self.size = size
+        self.dtype = np.dtype(dtype)
+        self.bins = bins
+        self.lim = lim
+        self.sum = np.zeros(size, complex if iscomplex else float)
+        self.sumsq = np.zeros(size) if var else None
+        if bins is None:
+            self.hist = None
+        elif iscomplex:
+            # 复数为每个点I、Q的二维直方图
+            self.hist = np.zeros((size, bins, bins), np.int64)
+        else:
+            self.hist = np.zeros((size, bins), np.int64)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.sum[:] = 0
+            if self.sumsq is not None:
+                self.sumsq[:] = 0
+            if self.hist is not None:
+                self.hist[:] = 0
+            self.count = 0
+
+    @property
+    def edges(self):
+        '''直方图的格子边界'''
+        return np.linspace(-self.lim, self.lim, self.bins + 1)
+
+    def _index(self, x):
+        i = ((x + self.lim) * (self.bins / (2 * self.lim))).astype(np.int64)
+        return np.clip(i, 0, self.bins - 1)
+
+    def add(self, block):
+        '''累加 (记录数, size) 的一块数据，计算在锁外进行'''
+        s = block.sum(axis=0)
+        sq = None
+        if self.sumsq is not None:
+            sq = (block.real**2 + block.imag**2).sum(axis=0)
+        h = None
+        if self.hist is not None:
+            flat = np.arange(self.size) * self.bins + self._index(block.real)
+            if self.hist.ndim == 3:
+                flat = flat * self.bins + self._index(block.imag)
+            h = np.bincount(flat.ravel(), minlength=self.hist.size)
+        with self._lock:
+            self.sum += s
+            if sq is not None:
+                self.sumsq += sq
+            if h is not None:
+                self.hist += h.reshape(self.hist.shape)
+            self.count += len(block)
+
+    def mean(self):
+        '''当前的平均值'''
+        with self._lock:
+            mean = self.sum / max(self.count, 1)
+        return self._cast(mean)
+
+    def var(self):
+        '''当前的方差，复数为 I、Q 方差之和'''
+        assert self.sumsq is not None
+        with self._lock:
+            c = max(self.count, 1)
+            var = self.sumsq / c - np.abs(self.sum / c)**2
+        return self._cast(var)
+
+    def _cast(self, x):
+        '''转换为dtype对应的精度，复数保持复数'''
+        if np.iscomplexobj(x):
+            return x.astype(np.result_type(self.dtype, np.complex64), copy=False)
+        return x.astype(self.dtype, copy=False)
+
+    def histogram(self):
+        '''当前直方图的副本'''
+        assert self.hist is not None
+        with self._lock:
+            return self.hist.copy()
+
+
 class Driver(BaseDriver):
     def __init__(self, addr=None, **kw):
         super().__init__(addr=addr,**kw)
@@ -46,11 +194,19 @@ class Driver(BaseDriver):
                            triggerDelay=0,
                            triggerTimeout=0,
                            recordsPerBuffer=64,
-                           bufferCount=512)
-        self.config['e'] = getExpArray(self.config['f_list'], self.config['n'],
-                                       self.config['weight'],
-                                       self.config['sampleRate'])
+                           bufferCount=512,
+                           dtype=np.float64,
+                           reuse=False,
+                           workers=0,
+                           ringDepth=16,
+                           demod='auto')
+        self.config['e'] = getDemodKernel(self.config['f_list'],
+                                          self.config['n'],
+                                          self.config['weight'],
+                                          self.config['sampleRate'])
         self.config['samplesPerRecord'] = getSamplesPerRecode(self.config['n'])
+        # reuse 为True时保存上次的结果数组，形状与类型不变时直接复用
+        self._out = None
 
     def performOpen(self):
         if self.addr is not None:
@@ -88,10 +244,10 @@ class Driver(BaseDriver):
                 1) * self.config['recordsPerBuffer']
 
         if any(key in ['f_list', 'n', 'weight', 'sampleRate'] for key in cmd):
-            self.config['e'] = getExpArray(self.config['f_list'],
-                                           self.config['n'],
-                                           self.config['weight'],
-                                           self.config['sampleRate'])
+            self.config['e'] = getDemodKernel(self.config['f_list'],
+                                              self.config['n'],
+                                              self.config['weight'],
+                                              self.config['sampleRate'])
 
         if any(key in [
                 'ARange', 'BRange', 'trigLevel', 'triggerDelay',
@@ -112,44 +268,166 @@ class Driver(BaseDriver):
                      repeats=repeats,
                      buffers=buffers,
                      recordsPerBuffer=recordsPerBuffer,
-                     timeout=timeout) as h:
+                     timeout=timeout,
+                     dtype=self.config['dtype']) as h:
             yield from h.read()
 
-    def getData(self, fft=False, avg=False):
-        samplesPerRecord = self.config['samplesPerRecord']
+    def _aquirePipelined(self, samplesPerRecord, repeats, recordsPerBuffer,
+                         timeout, count, write, workers=2, depth=16):
+        '''当前线程只等待DMA，原始数据写入有界环形缓冲，
+        workers个线程换算电压并调用 write(index, chA, chB) 写入第index个缓冲的结果；
+        numpy运算时释放GIL，采集与处理并行；共采集count个缓冲'''
+        with AutoDMA(self.handle,
+                     samplesPerRecord,
+                     repeats=repeats,
+                     buffers=None,
+                     recordsPerBuffer=recordsPerBuffer,
+                     timeout=timeout,
+                     dtype=self.config['dtype']) as h:
+            ring = h.ring(depth)
+            errors = []
+
+            def work():
+                # 每个线程一组换算用的通道缓冲
+                out = h.channels()
+                while True:
+                    item = ring.full.get()
+                    if item is None:
+                        return
+                    slot, index = item
+                    try:
+                        if not errors:
+                            chA, chB = h.convert(ring.data[slot], out)
+                            write(index, chA, chB)
+                    except Exception as err:
+                        errors.append(err)
+                    finally:
+                        ring.free.put(slot)
+
+            threads = [threading.Thread(target=work, daemon=True)
+                       for _ in range(workers)]
+            for t in threads:
+                t.start()
+            try:
+                for index, slot in enumerate(h.readIntoRing(ring)):
+                    ring.full.put((slot, index))
+                    if errors or index + 1 >= count:
+                        break
+            finally:
+                for t in threads:
+                    ring.full.put(None)
+                for t in threads:
+                    t.join()
+            if errors:
+                raise errors[0]
+
+    def _result(self, shape, dtype, out=None):
+        '''预分配结果数组 A, B；给定out=(A,B)时直接使用，
+        config中reuse为True时，形状和类型不变则复用上次的数组，不再分配'''
+        if out is not None:
+            A, B = out
+            assert A.shape == shape and B.shape == shape
+            return A, B
+        key = (shape, np.dtype(dtype).str)
+        if self.config['reuse'] and self._out is not None and self._out[0] == key:
+            return self._out[1]
+        A, B = np.empty(shape, dtype), np.empty(shape, dtype)
+        self._out = (key, (A, B)) if self.config['reuse'] else None
+        return A, B
+
+    def _records(self):
+        '''本次采集的记录数，为recordsPerBuffer的整数倍；
+        repeats为0时连续采集，直到得到maxlen条记录'''
         recordsPerBuffer = self.config['recordsPerBuffer']
         repeats = self.config['repeats']
-        e = self.config['e']
-        n = e.shape[0]
-        maxlen = self.config['maxlen']
+        records = repeats if repeats > 0 else self.config['maxlen']
+        return -(-records // recordsPerBuffer) * recordsPerBuffer
+
+    def _fftPlan(self):
+        '''FFT解调的参数 (N, 格点序号)，config中demod为'dot'，
+        或为'auto'且频率数少于log2(N)时返回None，使用解调矩阵'''
+        method = self.config['demod']
+        if method == 'dot':
+            return None
+        plan = getFFTBins(self.config['f_list'], self.config['n'],
+                          self.config['sampleRate'])
+        assert method != 'fft' or plan is not None, 'f_list is not on an FFT grid !'
+        if method == 'auto' and plan is not None and len(self.config['f_list']) < np.log2(plan[0]):
+            return None
+        return plan
+
+    def _block(self, fft, dtype):
+        '''返回 block(chA, chB)，把一个DMA缓冲换算为 (记录数, 采样点数) 的波形，
+        fft为True时为解调后的 (记录数, 频率数)；以及每条记录结果的长度；
+        解调用缓存的解调矩阵，频率多且都在FFT格点上时改用补0的FFT后取格点'''
+        samplesPerRecord = self.config['samplesPerRecord']
+        recordsPerBuffer = self.config['recordsPerBuffer']
+        n = self.config['n']
+        plan = self._fftPlan() if fft else None
+        ctype = np.result_type(dtype, np.complex64)
+
+        if plan is not None:
+            N, bins = plan
+            weight = self.config['weight']
+            w = None if weight is None else np.asarray(weight) / n
+            half = w is None or not np.iscomplexobj(w)
+            # 实数序列只有非负频率，负频率取对应正频率的共轭
+            neg = half & (bins > N // 2)
+            idx = np.where(neg, N - bins, bins)
+
+            def demod(X):
+                X = X[:, :n] if w is None else X[:, :n] * w
+                Y = np.fft.rfft(X, N) if half else np.fft.fft(X, N)
+                Y = Y[:, idx]
+                Y[:, neg] = np.conj(Y[:, neg])
+                return Y if w is not None else Y / n
+        elif fft:
+            # 1/n 预先乘进解调矩阵，每个缓冲只需一次矩阵乘法
+            e = getDemodKernel(self.config['f_list'], n, self.config['weight'],
+                               self.config['sampleRate'], ctype, 1 / n)
+
+            def demod(X):
+                return X[:, :n].dot(e)
 
-        A, B = None, None
+        def block(chA, chB):
+            A_lst = chA.reshape((recordsPerBuffer, samplesPerRecord))
+            B_lst = chB.reshape((recordsPerBuffer, samplesPerRecord))
+            if fft:
+                return demod(A_lst), demod(B_lst)
+            return A_lst, B_lst
 
+        return block, (len(self.config['f_list']) if fft else samplesPerRecord)
+
+    def _run(self, write, reset=None):
+        '''采集 _records() 条记录，每个缓冲调用 write(index, chA, chB)；
+        出错时按错误码重试，重试前调用reset()'''
+        samplesPerRecord = self.config['samplesPerRecord']
+        recordsPerBuffer = self.config['recordsPerBuffer']
+        repeats = self.config['repeats']
+        count = self._records() // recordsPerBuffer
+        timeout = self.config['triggerTimeout']
         retry = 0
         while retry < 3:
             try:
-                for chA, chB in self._aquireData(
-                        samplesPerRecord,
-                        repeats=repeats,
-                        buffers=None,
-                        recordsPerBuffer=recordsPerBuffer,
-                        timeout=self.config['triggerTimeout']):
-                    A_lst = chA.reshape((recordsPerBuffer, samplesPerRecord))
-                    B_lst = chB.reshape((recordsPerBuffer, samplesPerRecord))
-                    if fft:
-                        A_lst = (A_lst[:, :n]).dot(e) / n
-                        B_lst = (B_lst[:, :n]).dot(e) / n
-                    try:
-                        A = np.r_[A, A_lst]
-                        B = np.r_[B, B_lst]
-                    except:
-                        A, B = A_lst, B_lst
-                    if repeats == 0 and A.shape[1] >= maxlen:
-                        break
-                if avg:
-                    return A.mean(axis=0), B.mean(axis=0)
+                if reset is not None:
+                    reset()
+                # workers大于0时采集与换算、解调在不同线程中流水进行
+                if self.config['workers'] > 0:
+                    self._aquirePipelined(samplesPerRecord, repeats,
+                                          recordsPerBuffer, timeout, count,
+                                          write, self.config['workers'],
+                                          self.config['ringDepth'])
                 else:
-                    return A, B
+                    for index, (chA, chB) in enumerate(self._aquireData(
+                            samplesPerRecord,
+                            repeats=repeats,
+                            buffers=None,
+                            recordsPerBuffer=recordsPerBuffer,
+                            timeout=timeout)):
+                        write(index, chA, chB)
+                        if index + 1 >= count:
+                            break
+                return
             except AlazarTechError as err:
                 log.exception(err.msg)
                 if err.code == 518:
@@ -163,6 +441,58 @@ class Driver(BaseDriver):
         else:
             raise SystemExit(1)
 
+    def getData(self, fft=False, avg=False, out=None):
+        '''采集数据，每个DMA缓冲的数据直接写入预分配的结果数组；
+        fft为True时返回解调后的 (记录数, 频率数) 复数数组，否则返回 (记录数, 采样点数) 的波形；
+        config中dtype为np.float32时结果为float32/complex64；
+        out=(A,B)时结果写入给定的数组，需与结果形状相同；
+        avg为True时不保存每条记录，由getAverage流式累加后返回平均值'''
+        if avg:
+            accA, accB = self.getAverage(fft)
+            return accA.mean(), accB.mean()
+        recordsPerBuffer = self.config['recordsPerBuffer']
+        dtype = np.dtype(self.config['dtype'])
+        block, size = self._block(fft, dtype)
+        if fft:
+            dtype = np.result_type(dtype, np.complex64)
+        A, B = self._result((self._records(), size), dtype, out)
+
+        def write(index, chA, chB):
+            start = index * recordsPerBuffer
+            stop = start + recordsPerBuffer
+            A[start:stop], B[start:stop] = block(chA, chB)
+
+        self._run(write)
+        return A, B
+
+    def getAverage(self, fft=False, var=False, bins=None, lim=None,
+                   callback=None, every=1):
+        '''流式平均：每个DMA缓冲累加到Accumulator后即丢弃，内存与记录数无关；
+        var为True时同时累加平方和；bins不为None时累加每个点的直方图，范围为 ±lim，
+        lim默认为各通道的量程ARange/BRange；
+        callback不为None时，每累加every个缓冲调用 callback(accA, accB)，
+        可在采集过程中读取部分平均用于显示；返回 (accA, accB)'''
+        dtype = np.dtype(self.config['dtype'])
+        block, size = self._block(fft, dtype)
+        limA = self.config['ARange'] if lim is None else lim
+        limB = self.config['BRange'] if lim is None else lim
+        accA = Accumulator(size, fft, var, bins, limA, dtype)
+        accB = Accumulator(size, fft, var, bins, limB, dtype)
+
+        def write(index, chA, chB):
+            A_lst, B_lst = block(chA, chB)
+            accA.add(A_lst)
+            accB.add(B_lst)
+            if callback is not None and (index + 1) % every == 0:
+                callback(accA, accB)
+
+        def reset():
+            accA.reset()
+            accB.reset()
+
+        self._run(write, reset)
+        return accA, accB
+
     def getIQ(self, avg=False):
         return self.getData(True, avg)
 
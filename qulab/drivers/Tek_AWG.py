@@ -2,6 +2,7 @@
 import numpy as np
 
 from qulab.device import BaseDriver, QOption, QReal, QList
+from qulab.device.util import DAC_codes
 
 
 class Driver(BaseDriver):
@@ -170,8 +171,8 @@ class Driver(BaseDriver):
         message = 'WLIST:WAVEFORM:DATA "%s",%d,' % (name, start)
         if size is not None:
             message = message + ('%d,' % size)
-        points = points.clip(-1,1)
-        values = (points * 0x1fff).astype(int) + 0x1fff
+        values = DAC_codes(points, 0x1fff, 0x1fff, bits=14, unsigned=True,
+                           high=0x3ffe)
         self.write_binary_values(message, values, datatype=u'H',
                                  is_big_endian=False,
                                  termination=None, encoding=None)
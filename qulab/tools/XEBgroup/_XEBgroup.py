@@ -174,8 +174,7 @@ class xebgroup(GateGroup):
         '''根据索引序列产生波形序列'''
         pi_len, pi_factor, half_pi_len, half_pi_factor = pi_array
         cp_len, cp_factor = cp_array
-        res_wd=Wavedata(sRate=sRate)
-        buffer_wd=Blank(buffer,sRate)
+        seq=WaveSequence(sRate)
         for v in indexseq:
             XY_wd=self.gen_XY(v,pi_len,pi_factor,half_pi_len,half_pi_factor,cp_len,cp_factor,sRate,TYPE)
             amp=np.max(np.abs(XY_wd.data))
@@ -183,5 +182,5 @@ class xebgroup(GateGroup):
             # 将DRAG幅度用MHz表示，以便后续计算DRAG系数a，通常即为（拉比频率/非谐性）
             XY_wd_drag=1e-6*XY_wd_drag
             XY_wd=XY_wd+1j*XY_wd_drag*drag_ratio
-            res_wd=res_wd|XY_wd|buffer_wd
-        return res_wd
+            seq.append(XY_wd).blank(buffer)
+        return seq.to_wavedata()
@@ -163,20 +163,18 @@ class cliffordGroup(GateGroup):
         if check:
             assert self.check_seq(indexseq)
         pi_len, pi_factor, half_pi_len, half_pi_factor = pi_array
-        res_wd=Wavedata(sRate=sRate)
-        buffer_wd=Blank(buffer,sRate)
+        seq=WaveSequence(sRate)
         for v in indexseq:
             XY_wd=self.gen_XY(v,pi_len,pi_factor,half_pi_len,half_pi_factor,sRate,TYPE)
-            res_wd=res_wd|XY_wd|buffer_wd
-        return res_wd
+            seq.append(XY_wd).blank(buffer)
+        return seq.to_wavedata()
     
     def rbm_wd_drag(self, indexseq, pi_array, sRate, buffer=0, TYPE=Gaussian2, check=False):
         '''根据索引序列产生波形序列'''
         if check:
             assert self.check_seq(indexseq)
         pi_len, pi_factor, half_pi_len, half_pi_factor = pi_array
-        res_wd=Wavedata(sRate=sRate)
-        buffer_wd=Blank(buffer,sRate)
+        seq=WaveSequence(sRate)
         for v in indexseq:
             XY_wd=self.gen_XY(v,pi_len,pi_factor,half_pi_len,half_pi_factor,sRate,TYPE)
             amp=np.max(np.abs(XY_wd.data))
@@ -185,5 +183,5 @@ class cliffordGroup(GateGroup):
             XY_wd=1e-6*XY_wd
             #if 'n' in v:
             #    XY_wd = -XY_wd
-            res_wd=res_wd|XY_wd|buffer_wd
-        return res_wd
+            seq.append(XY_wd).blank(buffer)
+        return seq.to_wavedata()
@@ -1 +1,3 @@
-from ._multiprocess_for_single_shot import get_IQ
\ No newline at end of file
+from ._multiprocess_for_single_shot import get_IQ, SingleShotService, SharedArray
+from ._readout import ReadoutClassifier
+from ._weights import matched_template, matched_weights, integration_snr, set_driver_weights
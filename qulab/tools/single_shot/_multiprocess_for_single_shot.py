@@ -1,41 +1,202 @@
-import datetime
+import os
+import atexit
+import tempfile
 import numpy as np
 import multiprocessing as mp
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError: # Python 3.8以下没有shared_memory，改用memmap文件
+    shared_memory = resource_tracker = None
 from qulab.tools.wavedata import *
+from qulab.tools.wavedata._carrier import carrier
 
-def MP_func(I_data, Q_data, IF_filter0, IF_filter1, IF, sRate):
-    qubit_I0 = []
-    qubit_Q0 = []
-    for idx in range(int((I_data.shape)[0])):
-        I = I_data[idx]
-        Q = Q_data[idx]
-        wd_raw = Wavedata(I+1j*Q,sRate=sRate).filter(IF_filter0)
-        wd_raw = wd_raw.filter(IF_filter1)
-        iqcali = A.Analyze_cali(wd_raw, IF)
-        wd_f = A.Homodyne(wd_raw, freq=IF, cali=iqcali)
-        amp_I = np.mean(Wavedata.I(wd_f).data[50:-50])
-        amp_Q = np.mean(Wavedata.Q(wd_f).data[50:-50])
-        qubit_I0.append(amp_I)
-        qubit_Q0.append(amp_Q)
-    return np.array([np.array(qubit_I0),np.array(qubit_Q0)])
-
-def get_IQ(chA, chB, IF_filter0, IF_filter1, IF, sRate):
-    num_cores = int(mp.cpu_count())
-    record_per_processor = int((chA.shape)[0]/num_cores)
-    param_dict=[]
-    for n in range(num_cores-1):
-        I_data = chA[int(n*record_per_processor):int((n+1)*record_per_processor)]
-        Q_data = chB[int(n*record_per_processor):int((n+1)*record_per_processor)]
-        param_dict.append((I_data, Q_data, IF_filter0, IF_filter1, IF, 1e9))
-    I_data = chA[int((num_cores-1)*record_per_processor):]
-    Q_data = chB[int((num_cores-1)*record_per_processor):]
-    param_dict.append((I_data, Q_data, IF_filter0, IF_filter1, IF, 1e9))
-    
-    pool = mp.Pool(num_cores)
-    results = [pool.apply_async(MP_func, args=(I_data, Q_data, IF_filter0, IF_filter1, IF, sRate)) 
-               for I_data, Q_data, IF_filter0, IF_filter1, IF, sRate in param_dict]
-    results = [p.get() for p in results]
-    pool.close()
-    pool.join()
-    results = np.hstack(results)
-    return results
\ No newline at end of file
+def _IQ_points(I_data, Q_data, IF_filter, IF, sRate, shared_cali=False):
+    # 所有记录一起滤波，IF_filter为编译合并后的滤波器，只需滤波一次
+    batch = WaveBatch(I_data+1j*Q_data,sRate=sRate).filter(IF_filter)
+    # 所有记录一起校准、解调，直接得到积分后的IQ点；shared_cali为True时共用一个校正序列
+    iqcali = A.Analyze_cali_batch(batch, IF, per_record=not shared_cali)
+    IQ = A.Homodyne_batch(batch, IF, iqcali, window=slice(50,-50))
+    return np.array([IQ.real, IQ.imag])
+
+def MP_func(I_data, Q_data, IF_filter0, IF_filter1, IF, sRate, shared_cali=False):
+    # 两级滤波器编译合并
+    return _IQ_points(I_data, Q_data, F.series(IF_filter0, IF_filter1), IF, sRate, shared_cali)
+
+
+class SharedArray(object):
+    '''放在共享内存中的numpy数组，其他进程用spec=(name,shape,dtype)打开同一块内存；
+    没有multiprocessing.shared_memory时(Python 3.8以下)用临时的memmap文件，name为文件路径'''
+
+    def __init__(self, shape, dtype=float, name=None):
+        self.shape = tuple(int(n) for n in shape)
+        self.dtype = np.dtype(dtype)
+        nbytes = int(np.prod(self.shape))*self.dtype.itemsize
+        if shared_memory is not None:
+            self.shm = shared_memory.SharedMemory(name=name, create=name is None,
+                                                  size=max(nbytes, 1))
+            self.name = self.shm.name
+            buf = self.shm.buf
+        else:
+            self.shm = None
+            mode = 'r+'
+            if name is None:
+                fd, name = tempfile.mkstemp(suffix='.shm')
+                os.close(fd)
+                mode = 'w+'
+            self.name = name
+            buf = np.memmap(name, np.uint8, mode, shape=(max(nbytes, 1),))
+        self.array = np.ndarray(self.shape, self.dtype, buffer=buf)
+
+    @property
+    def spec(self):
+        return (self.name, self.shape, self.dtype.str)
+
+    def close(self):
+        '''关闭映射，之后array不可再用'''
+        self.array = None
+        if self.shm is not None:
+            try:
+                self.shm.close()
+            except BufferError: # 外部仍引用buffers()返回的数组，映射随其释放
+                pass
+
+    def unlink(self):
+        '''关闭并删除共享内存，只由创建方调用'''
+        self.close()
+        if self.shm is not None:
+            self.shm.unlink()
+        else:
+            try:
+                os.remove(self.name)
+            except OSError:
+                pass
+
+
+# 工作进程中的常驻状态：编译好的滤波器、参数以及已打开的共享数组
+_worker = {}
+
+def _init_worker(IF_filter0, IF_filter1, IF, sRate, shared_cali, size):
+    '''工作进程启动时执行一次：编译滤波器，预先生成解调载波表'''
+    _worker.update(filter=F.series(IF_filter0, IF_filter1), IF=IF,
+                   sRate=sRate, shared_cali=shared_cali, arrays={})
+    if size:
+        carrier(-2*np.pi*IF, 0, size, sRate, np.float64)
+
+def _open(specs):
+    '''按spec打开共享数组，重复使用已打开的映射，关闭不再使用的旧映射'''
+    arrays = _worker['arrays']
+    for spec in list(arrays):
+        if spec not in specs:
+            arrays.pop(spec).close()
+    for spec in specs:
+        if spec not in arrays:
+            arrays[spec] = SharedArray(spec[1], spec[2], spec[0])
+    return [arrays[spec].array for spec in specs]
+
+def _work(specA, specB, specOut, start, stop):
+    '''处理第start到stop条记录，结果直接写入共享输出数组'''
+    chA, chB, out = _open((specA, specB, specOut))
+    out[:, start:stop] = _IQ_points(chA[start:stop], chB[start:stop], _worker['filter'],
+                                    _worker['IF'], _worker['sRate'], _worker['shared_cali'])
+
+
+class SingleShotService(object):
+    '''常驻的单次读出处理服务：
+    工作进程只启动一次，启动时编译滤波器、生成载波表；
+    原始记录和结果都放在共享内存中，每次处理只传递记录范围，不再pickle数据；
+    shared_cali为True时，每个工作进程对自己的一段记录共用一个校正序列'''
+
+    def __init__(self, IF_filter0, IF_filter1, IF, sRate, shared_cali=False,
+                 processes=None, size=0):
+        self.params = (IF_filter0, IF_filter1, IF, sRate, shared_cali)
+        self.processes = processes or mp.cpu_count()
+        # 先启动resource_tracker，工作进程与本进程共用，共享内存只由本进程删除
+        if resource_tracker is not None:
+            resource_tracker.ensure_running()
+        self.pool = mp.Pool(self.processes, initializer=_init_worker,
+                            initargs=self.params+(size,))
+        self._inputs = None
+        self._output = None
+
+    def _match(self, IF_filter0, IF_filter1, IF, sRate, shared_cali=False):
+        '''参数是否与本服务相同，滤波器按对象判断'''
+        f0, f1, _IF, _sRate, _shared = self.params
+        return (f0 is IF_filter0 and f1 is IF_filter1 and _IF == IF
+                and _sRate == sRate and _shared == shared_cali)
+
+    def buffers(self, records, size, dtype=float):
+        '''返回共享内存中 (records,size) 的输入数组 chA, chB；
+        采集数据可以直接写入，形状不变时重复使用同一块共享内存'''
+        shape, dtype = (int(records), int(size)), np.dtype(dtype)
+        if self._inputs is None or self._inputs[0].shape != shape or self._inputs[0].dtype != dtype:
+            self._free()
+            self._inputs = [SharedArray(shape, dtype), SharedArray(shape, dtype)]
+            self._output = SharedArray((2, shape[0]), float)
+        return self._inputs[0].array, self._inputs[1].array
+
+    def process(self, out=None):
+        '''处理共享输入数组中的全部记录，返回 (2,记录数) 的 I、Q 数组；
+        给定out时结果复制到out中，否则返回新数组'''
+        assert self._inputs is not None, 'call buffers() first !'
+        chA, chB = self._inputs
+        records = chA.shape[0]
+        bounds = np.linspace(0, records, self.processes+1).astype(int)
+        tasks = [self.pool.apply_async(_work, (chA.spec, chB.spec, self._output.spec, lo, hi))
+                 for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+        for t in tasks:
+            t.get()
+        if out is None:
+            return self._output.array.copy()
+        out[...] = self._output.array
+        return out
+
+    def get_IQ(self, chA, chB, out=None):
+        '''复制到共享输入数组后处理，chA、chB为 (记录数,采样点数) 的数组'''
+        chA, chB = np.asarray(chA), np.asarray(chB)
+        assert chA.shape == chB.shape
+        a, b = self.buffers(chA.shape[0], chA.shape[-1], np.result_type(chA, chB))
+        a[...] = chA
+        b[...] = chB
+        return self.process(out)
+
+    def _free(self):
+        if self._inputs is not None:
+            for arr in self._inputs+[self._output]:
+                arr.unlink()
+        self._inputs = self._output = None
+
+    def close(self):
+        '''关闭工作进程，删除共享内存'''
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        self._free()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# get_IQ 使用的常驻服务，参数不变时重复使用
+_service = None
+
+def _close_service():
+    global _service
+    if _service is not None:
+        _service.close()
+        _service = None
+
+atexit.register(_close_service)
+
+def get_IQ(chA, chB, IF_filter0, IF_filter1, IF, sRate, shared_cali=False):
+    '''chA、chB 为 (记录数,采样点数) 的数组，返回 (2,记录数) 的 I、Q；
+    由常驻的SingleShotService处理，参数不变时不再重新启动进程'''
+    global _service
+    if _service is None or not _service._match(IF_filter0, IF_filter1, IF, sRate, shared_cali):
+        _close_service()
+        _service = SingleShotService(IF_filter0, IF_filter1, IF, sRate, shared_cali,
+                                     size=np.shape(chA)[-1])
+    return _service.get_IQ(chA, chB)
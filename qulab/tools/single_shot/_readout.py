@@ -0,0 +1,130 @@
+import numpy as np
+
+'''单次读出的在线判别模块：IQ点按批次累加到固定大小的二维直方图中，
+内存占用与测量次数无关，投影轴、阈值、保真度等都由直方图和累加和计算'''
+
+
+def as_complex(IQ):
+    '''把复数数组或 (2,N) 的 [I,Q] 数组转换为一维复数数组'''
+    IQ = np.asarray(IQ)
+    if not np.iscomplexobj(IQ) and IQ.ndim == 2 and IQ.shape[0] == 2:
+        IQ = IQ[0]+1j*IQ[1]
+    return np.ravel(IQ)
+
+
+class ReadoutClassifier(object):
+    '''在线读出判别器，每个制备态一个 bins x bins 的IQ二维直方图；
+    lims=(xmin,xmax,ymin,ymax) 为直方图范围，为None时由第一批数据确定，
+    超出范围的点计入边缘的格子；各态中心由累加和精确计算，不受分格影响；
+    两个态时沿中心连线投影后用阈值判别，多于两个态时按最近的中心判别'''
+
+    def __init__(self, states=2, bins=200, lims=None):
+        assert states >= 2
+        self.states = states
+        self.bins = bins
+        self.lims = None if lims is None else tuple(lims)
+        self.hist = np.zeros((states, bins, bins), np.int64)
+        self.count = np.zeros(states, np.int64)
+        self._sum = np.zeros(states, complex)
+        self._cache = None
+
+    def reset(self):
+        '''清空直方图和累加和，保留直方图范围'''
+        self.hist[...] = 0
+        self.count[...] = 0
+        self._sum[...] = 0
+        self._cache = None
+
+    def _set_lims(self, z):
+        '''由第一批数据确定直方图范围：数据范围向外扩展一倍'''
+        x0, x1, y0, y1 = z.real.min(), z.real.max(), z.imag.min(), z.imag.max()
+        dx, dy = max(x1-x0, 1e-12), max(y1-y0, 1e-12)
+        self.lims = (x0-dx/2, x1+dx/2, y0-dy/2, y1+dy/2)
+
+    def _index(self, z):
+        '''IQ点所在格子的一维序号'''
+        x0, x1, y0, y1 = self.lims
+        ix = np.clip(((z.real-x0)*(self.bins/(x1-x0))).astype(np.int64), 0, self.bins-1)
+        iy = np.clip(((z.imag-y0)*(self.bins/(y1-y0))).astype(np.int64), 0, self.bins-1)
+        return ix*self.bins+iy
+
+    def update(self, state, IQ):
+        '''把制备态state的一批IQ点累加到直方图中'''
+        z = as_complex(IQ)
+        if len(z) == 0:
+            return self
+        if self.lims is None:
+            self._set_lims(z)
+        self.hist[state] += np.bincount(self._index(z), minlength=self.bins**2
+                                        ).reshape(self.bins, self.bins)
+        self.count[state] += len(z)
+        self._sum[state] += z.sum()
+        self._cache = None
+        return self
+
+    @property
+    def centers(self):
+        '''各制备态IQ点的平均值'''
+        return self._sum/np.maximum(self.count, 1)
+
+    @property
+    def grid(self):
+        '''直方图各格子中心的复数坐标，形状 (bins,bins)'''
+        x0, x1, y0, y1 = self.lims
+        x = x0+(np.arange(self.bins)+0.5)*(x1-x0)/self.bins
+        y = y0+(np.arange(self.bins)+0.5)*(y1-y0)/self.bins
+        return x[:, None]+1j*y[None, :]
+
+    @property
+    def axis(self):
+        '''投影轴，与util.get_projection_axes相同，为0态中心指向1态中心反方向的单位复数'''
+        v = self.centers[0]-self.centers[1]
+        return v/np.abs(v)
+
+    def _threshold(self):
+        '''由两个态的直方图在投影轴上的分布计算阈值，方法与util.get_threshold_visibility相同'''
+        if self._cache is None:
+            p = np.real(self.grid/self.axis).ravel()
+            edges = np.linspace(p.min(), p.max(), 1001)
+            y = [np.histogram(p, edges, weights=h.ravel())[0].cumsum() for h in self.hist[:2]]
+            y = [c/max(c[-1], 1) for c in y]
+            i = np.abs(y[0]-y[1]).argmax()
+            self._cache = 0.5*(edges[i]+edges[i+1])
+        return self._cache
+
+    @property
+    def threshold(self):
+        '''两个态时投影后的判别阈值，投影值大于阈值判为0态'''
+        assert self.states == 2
+        return self._threshold()
+
+    def classify(self, IQ):
+        '''判别一批IQ点，返回各点的态序号'''
+        z = as_complex(IQ)
+        if self.states == 2:
+            return (np.real(z/self.axis) <= self._threshold()).astype(int)
+        return np.abs(z[:, None]-self.centers[None, :]).argmin(axis=1)
+
+    def assignment_matrix(self):
+        '''分配矩阵 M[i,j]：制备态i被判为态j的概率，由直方图计算'''
+        labels = self.classify(self.grid)
+        M = np.array([np.bincount(labels, weights=h.ravel(), minlength=self.states)
+                      for h in self.hist])
+        return M/np.maximum(M.sum(axis=1, keepdims=True), 1)
+
+    def fidelity(self):
+        '''平均分配保真度，即分配矩阵对角元的平均'''
+        return np.mean(np.diag(self.assignment_matrix()))
+
+    def visibility(self):
+        '''两个态时的可见度 P(0|0)-P(0|1)'''
+        M = self.assignment_matrix()
+        return M[0, 0]-M[1, 0]
+
+    def populations(self, IQ, correct=False):
+        '''一批IQ点判为各态的比例；correct为True时用分配矩阵修正读出误差'''
+        labels = self.classify(IQ)
+        P = np.bincount(labels, minlength=self.states)/max(len(labels), 1)
+        if correct:
+            P = np.linalg.solve(self.assignment_matrix().T, P)
+        return P
@@ -0,0 +1,85 @@
+import numpy as np
+
+'''积分权重(匹配滤波)模块：由各制备态的校准记录计算数字化仪解调用的积分权重；
+记录均为 (记录数, 采样点数) 的数组，沿记录方向向量化计算均值和方差；
+权重的时间轴与AlazarTechDigitizer的getExpArray一致，即 t = arange(n)/sampleRate'''
+
+
+def _records(data):
+    '''WaveBatch或二维序列转换为二维数组'''
+    return np.atleast_2d(np.asarray(getattr(data, 'data', data)))
+
+
+def _boxcar(x, width):
+    '''沿最后一维做宽度为width点的滑动平均，长度不变，边缘按实际点数平均'''
+    if width <= 1:
+        return x
+    c = np.cumsum(np.pad(x, [(0, 0)]*(x.ndim-1)+[(1, 0)]), axis=-1)
+    n = x.shape[-1]
+    lo = np.clip(np.arange(n)-width//2, 0, n)
+    hi = np.clip(np.arange(n)-width//2+width, 0, n)
+    return (c[..., hi]-c[..., lo])/(hi-lo)
+
+
+def _carrier(IF, n, sRate):
+    return np.exp(-2j*np.pi*IF*np.arange(n)/sRate)
+
+
+def matched_template(traces):
+    '''由各制备态的记录计算实数匹配滤波模板 r(t)，使 sum(x*r) 区分各态的信噪比最大；
+    两个态时 r = (均值0-均值1)/噪声方差；多于两个态时取白化后各态均值的第一主成分；
+    返回 (模板, 噪声方差)'''
+    traces = [_records(x) for x in traces]
+    assert len(traces) >= 2
+    means = np.array([x.mean(axis=0) for x in traces])
+    var = np.mean([x.var(axis=0) for x in traces], axis=0)
+    sigma = np.sqrt(np.maximum(var, var.max()*1e-6))
+    M = (means-means.mean(axis=0))/sigma
+    u = np.linalg.svd(M, full_matrices=False)[2][0]
+    r = u/sigma
+    if np.dot(means[0]-means[1], r) < 0: # 0态积分结果较大，与ReadoutClassifier的约定一致
+        r = -r
+    return r, var
+
+
+def matched_weights(traces, IF, sRate=1e9, smooth=None, normalize=True):
+    '''计算数字化仪解调用的复数积分权重w(t)，解调结果为 sum(x*w*exp(-2j*pi*IF*t))，
+    其实部即为匹配滤波的积分结果；
+    traces 为 [|0>记录, |1>记录(, |2>记录)]，每个为 (记录数, 采样点数) 的数组或WaveBatch；
+    smooth 为取包络时滑动平均的点数，默认为一个中频周期；normalize为True时最大模为1'''
+    r, _ = matched_template(traces)
+    n = len(r)
+    if smooth is None:
+        smooth = int(np.around(sRate/IF)) if IF else 1
+    # r = Re(a*exp(2j*pi*IF*t))，a 为慢变包络，取 w = conj(a) 即可
+    w = np.conj(2*_boxcar(r*_carrier(IF, n, sRate), smooth)) if IF else r.astype(complex)
+    if normalize:
+        w = w/np.abs(w).max()
+    return w
+
+
+def integration_snr(traces, IF, weight=None, sRate=1e9):
+    '''按数字化仪的解调方式积分后，0态与1态的分离与噪声之比；
+    噪声为沿两态中心连线方向投影后的标准差，weight为None时为等权积分'''
+    x0, x1 = _records(traces[0]), _records(traces[1])
+    n = x0.shape[-1]
+    e = _carrier(IF, n, sRate)
+    if weight is not None:
+        e = e*weight
+    z0, z1 = x0.dot(e)/n, x1.dot(e)/n
+    d = z0.mean()-z1.mean()
+    p0, p1 = np.real(z0*np.conj(d)), np.real(z1*np.conj(d))
+    return np.abs(d)**2/np.sqrt((p0.var()+p1.var())/2)
+
+
+def set_driver_weights(driver, traces, IF=None, **kw):
+    '''由校准记录计算积分权重并写入数字化仪驱动的weight设置，返回权重；
+    IF为None时使用驱动f_list中的第一个频率，采样率和点数取驱动的设置'''
+    n = driver.getValue('n')
+    sRate = driver.getValue('sampleRate')
+    IF = driver.getValue('f_list')[0] if IF is None else IF
+    traces = [_records(x)[:, :n] for x in traces]
+    assert traces[0].shape[-1] == n, 'traces are shorter than driver n !'
+    w = matched_weights(traces, IF, sRate, **kw)
+    driver.setValue('weight', w)
+    return w
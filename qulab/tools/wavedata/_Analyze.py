@@ -1,17 +1,26 @@
 import numpy as np
 import copy
 import matplotlib.pyplot as plt
-from ._wavedata import Wavedata
+from ._wavedata import Wavedata, dft_bins, _SINGLE
+from ._wavebatch import WaveBatch
 from ._wd_func import *
+from ._carrier import carrier
+from . import _resample
 
 
 '''Wavedata 额外的分析模块，传入Wavedata类实例，进行分析'''
 
 
+def _demod_carrier(wd, freq):
+    '''解调用的载波，取自载波表，单精度数据使用单精度载波'''
+    dtype = wd.dtype if wd.dtype in _SINGLE else None
+    data = carrier(-2*np.pi*freq, 0, wd.size, wd.sRate, dtype)
+    return Wavedata._from_array(data, wd.sRate)
+
 def Homodyne(wd, freq=50e6, cali=None, DEG=True):
     '''把信号按一定频率旋转，得到解调的IQ'''
     if cali is None:
-        res_wd=wd*Exp(-2*np.pi*freq,0,wd.len,wd.sRate)
+        res_wd=wd*_demod_carrier(wd, freq)
         return res_wd
     else:
         _cali = np.array(cali)
@@ -24,18 +33,15 @@ def Homodyne(wd, freq=50e6, cali=None, DEG=True):
         shift_I = _phi_I/(2*np.pi*freq) if not freq==0 else 0
         shift_Q = _phi_Q/(2*np.pi*freq) if not freq==0 else 0
 
-        # 相位校准，将I/Q插值函数平移后重新采样
-        func_I = lambda x: wd.I().timeFunc(kind='cubic')(x-shift_I)
-        _wd_I = Wavedata.init(func_I,(0,wd.len),wd.sRate)
-        func_Q = lambda x: wd.Q().timeFunc(kind='cubic')(x-shift_Q)
-        _wd_Q = Wavedata.init(func_Q,(0,wd.len),wd.sRate)
+        # 相位校准，I/Q分别做分数延时(一对FFT)
+        _wd = wd.delay(shift_I, shift_Q)
 
         # 反向校准，与vIQmixer中carry_wave校准相反
-        _wd_I=(_wd_I-_offset_I)/_scale_I
-        _wd_Q=(_wd_Q-_offset_Q)/_scale_Q
+        _wd_I=(_wd.I()-_offset_I)/_scale_I
+        _wd_Q=(_wd.Q()-_offset_Q)/_scale_Q
 
         _wd=_wd_I+1j*_wd_Q
-        res_wd=_wd*Exp(-2*np.pi*freq,0,wd.len,wd.sRate)
+        res_wd=_wd*_demod_carrier(wd, freq)
         return res_wd
 
 def Analyze_cali(wd, freq=50e6, DEG=True):
@@ -55,3 +61,121 @@ def Analyze_cali(wd, freq=50e6, DEG=True):
                            [_scale_Q,_offset_Q,_phase_Q]]
                           ).round(decimals=3) # 保留3位小数
     return cali_array
+
+
+def _as_batch(records, sRate=None):
+    '''WaveBatch原样返回，二维数组需给出sRate'''
+    if isinstance(records, WaveBatch):
+        return records
+    assert sRate is not None
+    return WaveBatch._from_array(np.atleast_2d(np.asarray(records)), sRate)
+
+def Analyze_cali_batch(records, freq=50e6, DEG=True, per_record=False, sRate=None):
+    '''多条记录一起计算IQ校正序列，records为WaveBatch或 (记录数,采样点数) 的数组(需给出sRate)；
+    per_record为False时所有记录共同估计一个2x3的校正序列，
+    振幅比和相位差由Q与I在freq处的互谱求得；
+    per_record为True时返回 (记录数,2,3)，与逐条调用Analyze_cali相同'''
+    batch = _as_batch(records, sRate)
+    n = batch.size
+    k = int(np.around(freq*n/batch.sRate))
+    # 对复数记录只计算 0, k, -k 三个DFT分量，由共轭对称性分出I、Q的分量
+    X = dft_bins(batch.data, [0, k, (n-k) % n])/n
+    Xc = np.conj(X[:, [0, 2, 1]])
+    para_I = (X+Xc)/2
+    para_Q = (X-Xc)/2j
+    if k > 0: #非0频成分乘2
+        para_I[:, 1] *= 2
+        para_Q[:, 1] *= 2
+    phi0 = 90 if DEG else np.pi/2
+    if per_record:
+        _offset_I, _offset_Q = para_I[:,0].real, para_Q[:,0].real
+        _scale_Q = np.abs(para_Q[:,1])/np.abs(para_I[:,1])
+        _phase_Q = np.angle(para_Q[:,1],deg=DEG)-np.angle(para_I[:,1],deg=DEG)+phi0
+    else:
+        _offset_I, _offset_Q = para_I[:,0].real.mean(), para_Q[:,0].real.mean()
+        ratio = np.sum(para_Q[:,1]*np.conj(para_I[:,1]))/np.sum(np.abs(para_I[:,1])**2)
+        _scale_Q = np.abs(ratio)
+        _phase_Q = np.angle(ratio,deg=DEG)+phi0
+
+    ones, zeros = np.ones_like(_scale_Q), np.zeros_like(_scale_Q)
+    cali_array = np.stack([np.stack([ones,_offset_I+zeros,zeros],axis=-1),
+                           np.stack([_scale_Q,_offset_Q+zeros,_phase_Q],axis=-1)],
+                          axis=-2).round(decimals=3) # 保留3位小数
+    return cali_array
+
+def _iq_dot(data, k_I, k_Q):
+    '''计算每条记录的 I·k_I+Q·k_Q，data为 I+1jQ，积分核为一维(共用)或与data同形；
+    复数记录看作I、Q交错排列的实数数组，与交错排列的实数积分核一次相乘，不复制记录'''
+    n = data.shape[-1]
+    if np.iscomplexobj(data):
+        data = np.ascontiguousarray(data)
+        X = data.view(np.finfo(data.dtype).dtype)
+        K = np.empty(k_I.shape[:-1]+(2*n, 2))
+        K[..., 0::2, 0], K[..., 0::2, 1] = k_I.real, k_I.imag
+        K[..., 1::2, 0], K[..., 1::2, 1] = k_Q.real, k_Q.imag
+    else:
+        X = data
+        K = np.stack([k_I.real, k_I.imag], axis=-1)
+    K = K.astype(X.dtype, copy=False)
+    res = X.dot(K) if K.ndim == 2 else np.einsum('ij,ijk->ik', X, K)
+    return res[..., 0]+1j*res[..., 1]
+
+def _homodyne_kernel(c, cali, freq, DEG, sRate):
+    '''由积分载波c和 (K,2,3) 的校正序列，得到K组I、Q的积分核 (K,采样点数) 及常数项 (K,)；
+    设A为延时算子，I延时后的实部为Re(A)I，虚部为Im(A)I；Q乘以1j后延时，实部为-Im(A)Q，虚部为Re(A)Q；
+    与c做内积并按振幅校准合并，即得到积分核；每组只需一次FFT'''
+    _scale_I, _offset_I = cali[:,0,0,None], cali[:,0,1]
+    _scale_Q, _offset_Q = cali[:,1,0,None], cali[:,1,1]
+    #转为弧度
+    _phi = cali[:,:,2]*np.pi/180 if DEG else cali[:,:,2]
+    # 相位校准对应的延时点数，与Homodyne相同
+    _phi = 0*_phi if freq == 0 else _phi/(2*np.pi*freq)*sRate
+    d_I, d_Q = _phi[:,0,None], _phi[:,1,None]
+    # 每条记录的FFT长度与Homodyne中相同，按FFT长度分组计算
+    pad = np.ceil(np.maximum(np.abs(d_I), np.abs(d_Q)))[:,0]
+
+    # 除奈奎斯特频率外相位因子共轭对称，A作用在实数上结果为实数；N为偶数时，
+    # 奈奎斯特频率处的相位因子 exp(1j*pi*d) 使 Im(A) 为秩1矩阵 sin(pi*d)/N*s*s^T，s=(-1)^j
+    s = 1-2*(np.arange(len(c)) % 2)
+    def transpose(d):
+        '''返回 Re(A)^T c 和 Im(A)^T c'''
+        re_T = np.empty((len(d), len(c)), complex)
+        im_T = np.zeros((len(d), len(c)), complex)
+        for p in np.unique(pad):
+            rows = pad == p
+            N = _resample.delay_len(len(c), p)
+            if N % 2 == 0:
+                im_T[rows] = np.sin(np.pi*d[rows])/N*s*np.dot(s, c)
+            re_T[rows] = _resample.delay_fft_T(c, d[rows], N)-1j*im_T[rows]
+        return re_T, im_T
+    re_T, im_T = transpose(d_I)
+    k_I = re_T/_scale_I + 1j*im_T/_scale_Q
+    re_T, im_T = transpose(d_Q)
+    k_Q = -im_T/_scale_I + 1j*re_T/_scale_Q
+    const = -np.sum(c)*(_offset_I/_scale_I[:,0] + 1j*_offset_Q/_scale_Q[:,0])
+    return k_I, k_Q, const
+
+def Homodyne_batch(records, freq=50e6, cali=None, DEG=True, window=slice(None),
+                   sRate=None, chunk=1024):
+    '''多条记录一起解调并在window内求平均，直接返回每条记录的复数IQ点；
+    结果与逐条 Homodyne(wd,freq,cali) 后取 data[window] 的平均相同；
+    cali为None、2x3的共同校正序列，或 (记录数,2,3) 的逐条校正序列；
+    相位校准的分数延时、振幅校准和解调载波都是线性的，合并为与I/Q做内积的积分核，
+    共同校正时所有记录只需一次矩阵乘法；逐条校正时每chunk条记录计算一次积分核'''
+    batch = _as_batch(records, sRate)
+    n = batch.size
+    idx = np.arange(n)[window]
+    c = np.zeros(n, complex)
+    c[idx] = carrier(-2*np.pi*freq, 0, n, batch.sRate, np.float64)[idx]/len(idx)
+    if cali is None:
+        return _iq_dot(batch.data, c, 1j*c)
+
+    _cali = np.array(cali, dtype=float)
+    if _cali.ndim == 2:
+        k_I, k_Q, const = _homodyne_kernel(c, _cali[None], freq, DEG, batch.sRate)
+        return _iq_dot(batch.data, k_I[0], k_Q[0])+const[0]
+    res = []
+    for i in range(0, batch.records, chunk):
+        k_I, k_Q, const = _homodyne_kernel(c, _cali[i:i+chunk], freq, DEG, batch.sRate)
+        res.append(_iq_dot(batch.data[i:i+chunk], k_I, k_Q)+const)
+    return np.concatenate(res)
@@ -1,6 +1,7 @@
 import numpy as np
 from ._wavedata import Wavedata
 import scipy.signal as signal
+from scipy.fftpack import next_fast_len
 import matplotlib.pyplot as plt
 
 '''Wavedata 滤波器模块，包含一些数字滤波器'''
@@ -20,27 +21,7 @@ class Filter(object):
         '''传入Wavedata，返回滤波后的Waveda'''
         assert isinstance(w,Wavedata)
         data,sRate = self.process(w.data,w.sRate)
-        return Wavedata(data,sRate)
-
-
-def series(*arg):
-    '''串联多个Filter'''
-    def process(data,sRate):
-        for f in arg:
-            data,sRate = f.process(data,sRate)
-        return data,sRate
-    F = Filter(process)
-    return F
-
-
-def parallel(*arg):
-    '''并联多个Filter'''
-    def process(data,sRate):
-        d_list = [f.process(data,sRate)[0] for f in arg]
-        d = np.array(d_list).sum(axis=0)/len(arg)
-        return d,sRate
-    F = Filter(process)
-    return F
+        return w._new(data,sRate)
 
 
 class WGN(Filter):
@@ -51,9 +32,10 @@ class WGN(Filter):
     def process(self,data,sRate):
         x=data
         snr = 10**(self.snr/10.0)
-        xpower = np.sum(x**2)/len(x)
+        # 二维数据(WaveBatch)按每条记录分别计算功率
+        xpower = np.mean(x**2, axis=-1, keepdims=True)
         npower = xpower / snr
-        n = np.random.randn(len(x)) * np.sqrt(npower)
+        n = np.random.randn(*np.shape(x)) * np.sqrt(npower)
         _data = x + n
         return _data,sRate
 
@@ -85,24 +67,271 @@ class baFilter(Filter):
         plt.xlabel('Frequency')
         plt.ylabel('factor')
 
-class IIRFilter(baFilter):
+
+def overlap_save(h, x, zi=None, nfft=None):
+    '''重叠保留法FFT卷积，沿最后一维做因果FIR滤波 y[n]=sum(h[k]*x[n-k])；
+    zi为上一块末尾的len(h)-1个输入点，None表示补0；
+    所有分块一次完成FFT，返回 (y, zf)，y与x等长，zf作为下一块的zi'''
+    h = np.asarray(h)
+    x = np.asarray(x)
+    m, n = len(h), x.shape[-1]
+    dtype = np.result_type(h, x, float)
+    if zi is None:
+        zi = np.zeros(x.shape[:-1]+(m-1,), dtype)
+    xx = np.concatenate([zi, x], axis=-1).astype(dtype, copy=False)
+    zf = xx[..., xx.shape[-1]-(m-1):]
+    if n == 0:
+        return np.zeros(x.shape, dtype), zf
+    if nfft is None:
+        nfft = next_fast_len(max(8*m, 64))
+    L = nfft-m+1  # 每块有效输出点数
+    nblocks = -(-n//L)
+    pad = nblocks*L+m-1-xx.shape[-1]
+    xx = np.concatenate([xx, np.zeros(x.shape[:-1]+(pad,), dtype)], axis=-1)
+    # 相邻分块重叠m-1点，用步长视图构造 (..., nblocks, nfft)，不复制数据
+    st = xx.strides[-1]
+    blocks = np.lib.stride_tricks.as_strided(
+        xx, xx.shape[:-1]+(nblocks, nfft), xx.strides[:-1]+(L*st, st),
+        writeable=False)
+    if np.iscomplexobj(xx):
+        y = np.fft.ifft(np.fft.fft(blocks)*np.fft.fft(h, nfft))
+    else:
+        y = np.fft.irfft(np.fft.rfft(blocks)*np.fft.rfft(h, nfft), nfft)
+    y = y[..., m-1:].reshape(x.shape[:-1]+(nblocks*L,))[..., :n]
+    return y, zf.copy()
+
+
+class StreamFilter(Filter):
+    '''因果流式滤波器，数据分块到达时逐块调用process，块之间传递滤波器状态；
+    各块结果拼接后与对整段数据做一次因果滤波相同；
+    由sosFilter.stream()或FIRFilter.stream()得到'''
+    def __init__(self, sos=None, h=None, fs=None):
+        assert (sos is None) != (h is None)
+        self.sos = sos
+        self.h = h
+        self.fs = fs
+        self.reset()
+
+    def reset(self):
+        '''清除状态，开始新的数据流'''
+        self.zi = None
+        return self
+
+    def process(self,data,sRate):
+        assert sRate == self.fs
+        data = np.asarray(data)
+        if self.sos is None:
+            _data, self.zi = overlap_save(self.h, data, self.zi)
+            return _data, sRate
+        if self.zi is None:
+            shape = (len(self.sos),)+data.shape[:-1]+(2,)
+            self.zi = np.zeros(shape, np.result_type(self.sos, data))
+        _data, self.zi = signal.sosfilt(self.sos, data, axis=-1, zi=self.zi)
+        return _data, sRate
+
+
+class sosFilter(Filter):
+    """指定signal里包含的滤波器函数名,生成二阶节(sos)形式的数字滤波器；
+    高阶ellip/bessel等设计用sos形式比ba形式数值稳定；
+    causal为False时用sosfiltfilt零相位滤波，为True时单向因果滤波."""
+    def __init__(self, name='', causal=False, **kw):
+        kw.update(output='sos',analog=False)
+        self.dict=kw  # self.dict必须包含fs
+        self.causal = causal
+        filtertype = getattr(signal,name)
+        self.sos = filtertype(**self.dict)
+
+    @classmethod
+    def from_sos(cls, sos, fs, causal=False):
+        '''由已有的sos系数构造'''
+        f = cls.__new__(cls)
+        f.dict = dict(fs=fs)
+        f.causal = causal
+        f.sos = np.asarray(sos)
+        return f
+
+    @property
+    def ba(self):
+        '''等效的ba系数'''
+        return signal.sos2tf(self.sos)
+
+    def process(self,data,sRate):
+        assert sRate == self.dict['fs']
+        if self.causal:
+            _data = signal.sosfilt(self.sos, data, axis=-1)
+        else:
+            _data = signal.sosfiltfilt(self.sos, data, axis=-1)
+        return _data, sRate
+
+    def stream(self):
+        '''返回因果流式滤波器，逐块滤波并在块之间传递zi'''
+        return StreamFilter(sos=self.sos, fs=self.dict['fs'])
+
+    def freqz(self):
+        '''返回数字滤波器频率响应'''
+        w,h = signal.sosfreqz(self.sos,fs=self.dict['fs'])
+        return w,h
+
+    plot = baFilter.plot
+
+class IIRFilter(sosFilter):
     '''参考scipy.signal.iirfilter'''
     def __init__(self, N=2, Wn=[49e6, 51e6], rp=0.01, rs=100, btype='band',
-                     ftype='ellip', fs=1e9):
-        # 为避免麻烦，不继承 baFilter.__init__ 函数，只继承其他函数
+                     ftype='ellip', fs=1e9, causal=False):
+        # 为避免麻烦，不继承 sosFilter.__init__ 函数，只继承其他函数
         # 默认参数是一个50MHz的 ellip 滤波器
-        # 配置字典, default: output='ba',analog=False,
+        # 配置字典, default: output='sos',analog=False,
         self.dict=dict(N=N, Wn=Wn, rp=rp, rs=rs, btype=btype,
-                        analog=False, ftype=ftype, output='ba', fs=fs)
-        self.ba = signal.iirfilter(**self.dict)
+                        analog=False, ftype=ftype, output='sos', fs=fs)
+        self.causal = causal
+        self.sos = signal.iirfilter(**self.dict)
 
-class BesselFilter(baFilter):
+class BesselFilter(sosFilter):
     '''参考scipy.signal.bessel'''
     def __init__(self, N=2, Wn=100e6, btype='low',
-                     norm='phase', fs=1e9):
-        # 为避免麻烦，不继承 baFilter.__init__ 函数，只继承其他函数
+                     norm='phase', fs=1e9, causal=False):
+        # 为避免麻烦，不继承 sosFilter.__init__ 函数，只继承其他函数
         # 默认参数是一个100MHz的 2阶低通贝塞尔滤波器
-        # 配置字典, default: output='ba',analog=False,
+        # 配置字典, default: output='sos',analog=False,
         self.dict=dict(N=N, Wn=Wn, btype=btype,
-                        analog=False, output='ba', norm=norm, fs=fs)
-        self.ba = signal.bessel(**self.dict)
+                        analog=False, output='sos', norm=norm, fs=fs)
+        self.causal = causal
+        self.sos = signal.bessel(**self.dict)
+
+class FIRFilter(Filter):
+    '''FIR滤波器，参考scipy.signal.firwin，也可以直接给出系数h；
+    用重叠保留法FFT卷积滤波，causal为False时补偿(numtaps-1)/2点的群延迟，
+    为True时单向因果滤波'''
+    def __init__(self, numtaps=101, cutoff=100e6, window='hamming',
+                     pass_zero=True, fs=1e9, h=None, causal=False):
+        self.dict=dict(numtaps=numtaps, cutoff=cutoff, window=window,
+                        pass_zero=pass_zero, fs=fs)
+        self.causal = causal
+        if h is None:
+            h = signal.firwin(**self.dict)
+        self.h = np.asarray(h)
+
+    def process(self,data,sRate):
+        assert sRate == self.dict['fs']
+        data = np.asarray(data)
+        if self.causal:
+            _data, _ = overlap_save(self.h, data)
+            return _data, sRate
+        # 末尾补d点后因果滤波，去掉前d点，使输出与输入对齐
+        d = (len(self.h)-1)//2
+        pad = np.zeros(data.shape[:-1]+(d,), data.dtype)
+        _data, _ = overlap_save(self.h, np.concatenate([data, pad], axis=-1))
+        return _data[..., d:], sRate
+
+    def stream(self):
+        '''返回因果流式滤波器，逐块滤波并在块之间传递末尾的输入点'''
+        return StreamFilter(h=self.h, fs=self.dict['fs'])
+
+    def freqz(self):
+        '''返回数字滤波器频率响应'''
+        w,h = signal.freqz(self.h,fs=self.dict['fs'])
+        return w,h
+
+    plot = baFilter.plot
+
+
+### 串联/并联，构造时编译合并线性滤波器
+def _linear(f):
+    '''线性滤波器返回 (类型, fs, causal)，WGN、自定义process等返回None'''
+    if isinstance(f, FIRFilter):
+        return ('fir', f.dict['fs'], f.causal)
+    if isinstance(f, sosFilter):
+        return ('sos', f.dict['fs'], f.causal)
+    if isinstance(f, baFilter):
+        return ('sos', f.dict['fs'], False)
+    return None
+
+def _sos(f):
+    return f.sos if isinstance(f, sosFilter) else signal.tf2sos(*f.ba)
+
+def _merge_series(f1, f2):
+    '''合并相邻的两个同类因果线性滤波器，不能合并时返回None；
+    sos直接拼接各节，FIR系数卷积；零相位滤波逐级在记录两端补边，
+    合并后边缘结果不同，不合并'''
+    key = _linear(f1)
+    if key is None or key != _linear(f2) or not key[2]:
+        return None
+    kind, fs, causal = key
+    if kind == 'sos':
+        return sosFilter.from_sos(np.vstack([_sos(f1), _sos(f2)]), fs, causal)
+    return FIRFilter(h=np.convolve(f1.h, f2.h), fs=fs, causal=causal)
+
+def _merge_parallel(branches):
+    '''把并联的FIR滤波器合并为一个等效滤波器(各支路系数的平均)，不能合并时返回None；
+    IIR支路的平均需要ba形式通分，高阶时数值不稳定，不合并'''
+    keys = set(_linear(f) for f in branches)
+    if len(keys) != 1 or None in keys:
+        return None
+    kind, fs, causal = keys.pop()
+    if kind != 'fir':
+        return None
+    hs = [f.h for f in branches]
+    if not causal and not all(len(h) % 2 for h in hs):
+        return None
+    m = max(len(h) for h in hs)
+    h = np.zeros(m, np.result_type(*hs))
+    for _h in hs:
+        start = 0 if causal else (m-len(_h))//2
+        h[start:start+len(_h)] += _h
+    return FIRFilter(h=h/len(hs), fs=fs, causal=causal)
+
+def _simplify(f):
+    '''只剩一级的串联返回该级，可以合并的并联返回合并后的滤波器'''
+    if isinstance(f, Series) and len(f.stages) == 1:
+        return f.stages[0]
+    if isinstance(f, Parallel) and f.merged is not None:
+        return f.merged
+    return f
+
+
+class Series(Filter):
+    '''串联的Filter；构造时展开嵌套的串联，相邻的同类因果线性滤波器合并为一级，
+    WGN和自定义process保持为单独的一级；stages为编译后的各级'''
+    def __init__(self, *arg):
+        self.filters = list(arg)
+        self.stages = []
+        for g in map(_simplify, arg):
+            for f in (g.stages if isinstance(g, Series) else [g]):
+                merged = _merge_series(self.stages[-1], f) if self.stages else None
+                if merged is None:
+                    self.stages.append(f)
+                else:
+                    self.stages[-1] = merged
+
+    def process(self,data,sRate):
+        for f in self.stages:
+            data,sRate = f.process(data,sRate)
+        return data,sRate
+
+
+class Parallel(Filter):
+    '''并联的Filter，输出为各支路的平均；构造时编译各支路，
+    都是同类FIR滤波器时合并为一个等效滤波器merged，只需滤波一次'''
+    def __init__(self, *arg):
+        self.filters = list(arg)
+        self.branches = [_simplify(f) for f in arg]
+        self.merged = _merge_parallel(self.branches)
+
+    def process(self,data,sRate):
+        if self.merged is not None:
+            return self.merged.process(data,sRate)
+        d = None
+        for f in self.branches:
+            _d = f.process(data,sRate)[0]
+            d = _d if d is None else d+_d
+        return d/len(self.branches),sRate
+
+
+def series(*arg):
+    '''串联多个Filter，相邻的因果线性滤波器编译合并，参考Series'''
+    return Series(*arg)
+
+
+def parallel(*arg):
+    '''并联多个Filter，FIR滤波器编译合并，参考Parallel'''
+    return Parallel(*arg)
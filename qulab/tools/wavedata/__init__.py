@@ -1,6 +1,10 @@
-from ._wavedata import Wavedata
+from ._wavedata import Wavedata, set_default_dtype, get_default_dtype
+from ._lazy import lazy, set_lazy
+from ._sequence import WaveSequence
+from ._wavebatch import WaveBatch
+from ._stream import filter_chunks, integrate_chunks, psd_chunks
 from ._wd_func import *
-from ._vIQmixer import vIQmixer
+from ._vIQmixer import vIQmixer, up_convert
 from . import _Filter as F
 from . import _process as p
 from . import _Analyze as A
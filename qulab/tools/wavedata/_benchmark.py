@@ -0,0 +1,228 @@
+import gc
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import numpy as np
+from collections import OrderedDict
+
+'''wavedata 性能基准：记录Wavedata运算、脉冲生成、滤波、解调、上变频和RB序列生成的
+耗时与峰值内存，用于跟踪性能回归；
+命令行运行： python -m qulab.tools.wavedata._benchmark [-k 关键字] [--json 结果文件] [--compare 旧结果文件]'''
+
+# 每项为 名称 -> setup函数，setup返回被计时的无参函数
+_cases = OrderedDict()
+
+# 典型参数：1-100us 的脉冲，1-2.4GS/s 的采样率，10^4 条记录，500 个Clifford门
+WIDTHS = (1e-6, 10e-6, 100e-6)
+SRATES = (1e9, 2.4e9)
+RECORDS = 10000
+CLIFFORDS = 500
+
+
+def case(name, **params):
+    '''注册基准项，params中的每个序列展开为一组参数，名称中的{}按参数格式化'''
+    keys = list(params)
+    def decorator(setup):
+        combos = [()]
+        for k in keys:
+            combos = [c+(v,) for c in combos for v in params[k]]
+        for c in combos:
+            kw = dict(zip(keys, c))
+            _cases[name.format(**{k: _label(v) for k, v in kw.items()})] = (setup, kw)
+        return setup
+    return decorator
+
+
+def _wd(width, sRate, IQ=False, seed=0):
+    from ._wavedata import Wavedata
+    rng = np.random.RandomState(seed)
+    n = int(round(width*sRate))
+    data = rng.randn(n)+1j*rng.randn(n) if IQ else rng.randn(n)
+    return Wavedata(data, sRate)
+
+
+def _label(v):
+    '''名称中的参数：小于1ms的时间用us表示，采样率用GS表示'''
+    if isinstance(v, float) and v < 1e-3:
+        return '{:g}us'.format(v*1e6)
+    if isinstance(v, float) and v >= 1e8:
+        return '{:g}GS'.format(v/1e9)
+    return str(v)
+
+
+@case('wavedata.add_mul[{w}@{s}]', w=WIDTHS, s=SRATES)
+def _(w, s):
+    a = _wd(w, s)
+    b = _wd(w, s, seed=1)
+    return lambda: (a+b*a-0.5*b).data
+
+
+@case('wavedata.FFT[{w}@2.4GS]', w=WIDTHS)
+def _(w):
+    a = _wd(w, 2.4e9)
+    return lambda: a.FFT().data
+
+
+@case('wavedata.delay[{w}@2.4GS]', w=WIDTHS)
+def _(w):
+    a = _wd(w, 2.4e9, IQ=True)
+    return lambda: a.delay(0.37e-9).data
+
+
+@case('wd_func.{f}[{w}@2.4GS]', f=('Gaussian2', 'DRAGpulse', 'Cos', 'Exp'), w=WIDTHS)
+def _(f, w):
+    from . import _wd_func
+    func = getattr(_wd_func, f)
+    def run():
+        # 清空缓存，测量冷启动生成的耗时
+        _wd_func.clear_pulse_cache()
+        _wd_func.clear_carrier_cache()
+        if f in ('Cos', 'Exp'):
+            return func(2*np.pi*100e6, 0, w, 2.4e9).data
+        return func(w, 2.4e9).data
+    return run
+
+
+@case('filter.series[{w}@2.4GS]', w=WIDTHS)
+def _(w):
+    from . import _Filter as F
+    a = _wd(w, 2.4e9)
+    f = F.series(F.IIRFilter(N=2, Wn=[45e6, 55e6], fs=2.4e9),
+                 F.BesselFilter(N=2, Wn=200e6, fs=2.4e9))
+    return lambda: a.filter(f).data
+
+
+@case('filter.FIR[{w}@2.4GS]', w=WIDTHS)
+def _(w):
+    from . import _Filter as F
+    a = _wd(w, 2.4e9)
+    f = F.FIRFilter(numtaps=201, cutoff=100e6, fs=2.4e9)
+    return lambda: a.filter(f).data
+
+
+@case('analyze.{f}[{w}@1GS]', f=('Homodyne', 'Analyze_cali'), w=WIDTHS)
+def _(f, w):
+    from . import _Analyze as A
+    from ._wd_func import Exp
+    a = Exp(2*np.pi*50e6, 0, w, 1e9)+0.1*_wd(w, 1e9, IQ=True)
+    if f == 'Homodyne':
+        cali = A.Analyze_cali(a, 50e6)
+        return lambda: A.Homodyne(a, 50e6, cali).data
+    return lambda: A.Analyze_cali(a, 50e6)
+
+
+@case('batch.{f}[1e4x1us@1GS]', f=('filter', 'Analyze_cali_batch', 'Homodyne_batch'))
+def _(f):
+    from . import _Analyze as A
+    from . import _Filter as F
+    from ._wavebatch import WaveBatch
+    rng = np.random.RandomState(0)
+    t = (np.arange(1000)+0.5)/1e9
+    data = np.exp(2j*np.pi*50e6*t)+0.3*(rng.randn(RECORDS, 1000)+1j*rng.randn(RECORDS, 1000))
+    batch = WaveBatch._from_array(data, 1e9)
+    if f == 'filter':
+        flt = F.series(F.IIRFilter(N=2, Wn=[45e6, 55e6], fs=1e9),
+                       F.BesselFilter(N=2, Wn=200e6, fs=1e9))
+        return lambda: batch.filter(flt).data
+    if f == 'Analyze_cali_batch':
+        return lambda: A.Analyze_cali_batch(batch, 50e6, per_record=True)
+    cali = A.Analyze_cali_batch(batch, 50e6)
+    return lambda: A.Homodyne_batch(batch, 50e6, cali, window=slice(50, -50))
+
+
+@case('vIQmixer.carry_wave[{w}@2.4GS]', w=WIDTHS)
+def _(w):
+    from ._vIQmixer import vIQmixer
+    a = _wd(w, 2.4e9, IQ=True)
+    cali = [[1.02, 0.01, 1.5], [0.98, -0.01, -2.0]]
+    return lambda: vIQmixer.carry_wave(100e6, IQ=a, carry_cali=cali).data
+
+
+@case('clifford.rbm_wd[{n}@2.4GS]', n=(CLIFFORDS,))
+def _(n):
+    from qulab.tools.cliffordgroup import cliffordGroup
+    cg = cliffordGroup()
+    np.random.seed(0)
+    seq = cg.rbm_seq(n)
+    pi_array = (20e-9, 1, 20e-9, 0.5)
+    return lambda: cg.rbm_wd(seq, pi_array, 2.4e9, buffer=2e-9).data
+
+
+def measure(func, repeat=5, min_time=0.2):
+    '''先调用一次预热；再计时，每轮调用次数使单轮耗时不少于min_time，重复repeat轮；
+    最后在tracemalloc下单独调用一次得到峰值内存；
+    返回 dict(time=每次调用的最短耗时, median=中位耗时, peak=峰值内存字节数)'''
+    func()
+    t0 = time.perf_counter()
+    func()
+    once = max(time.perf_counter()-t0, 1e-9)
+    number = max(1, int(min_time/once))
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter()-t0)/number)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return dict(time=min(times), median=float(np.median(times)), peak=peak)
+
+
+def run(keyword=None, repeat=5, min_time=0.2, stream=sys.stdout):
+    '''运行名称中包含keyword的基准项，返回 名称 -> 结果 的字典'''
+    results = OrderedDict()
+    for name, (setup, kw) in _cases.items():
+        if keyword and keyword not in name:
+            continue
+        results[name] = measure(setup(**kw), repeat, min_time)
+        if stream is not None:
+            stream.write(_format(name, results[name])+'\n')
+            stream.flush()
+    return results
+
+
+def compare(results, old, stream=sys.stdout):
+    '''与旧结果比较耗时和峰值内存，返回 名称 -> (耗时比, 内存比)'''
+    ratios = OrderedDict()
+    for name, r in results.items():
+        if name in old:
+            ratios[name] = (r['time']/old[name]['time'], r['peak']/max(old[name]['peak'], 1))
+            if stream is not None:
+                stream.write('{:<45s} time x{:<7.2f} peak x{:.2f}\n'.format(name, *ratios[name]))
+    return ratios
+
+
+def _format(name, r):
+    t = r['time']
+    unit, k = ('s', 1) if t >= 1 else ('ms', 1e3) if t >= 1e-3 else ('us', 1e6)
+    return '{:<45s} {:>9.3f} {:<2s} {:>10.2f} MB'.format(name, t*k, unit, r['peak']/2**20)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='wavedata benchmarks')
+    parser.add_argument('-k', dest='keyword', default=None, help='只运行名称包含该关键字的项')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2)
+    parser.add_argument('--json', default=None, help='结果保存为json文件')
+    parser.add_argument('--compare', default=None, help='与之前保存的json结果比较')
+    args = parser.parse_args(argv)
+    results = run(args.keyword, args.repeat, args.min_time)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+import threading
+from collections import OrderedDict
+
+'''Wavedata 缓存模块：有容量上限的LRU缓存，缓存的数组均为只读共享'''
+
+
+class LRUCache(object):
+    '''LRU缓存，超过maxsize时丢弃最久未使用的项；
+    缓存的数组设为只读，多个Wavedata可共享同一份数据'''
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, factory):
+        '''返回key对应的数组，不存在时调用factory()生成并缓存'''
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+        return self.put(key, factory())
+
+    def put(self, key, value):
+        '''直接存入(或替换)key对应的数组'''
+        value.setflags(write=False)
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def info(self):
+        '''缓存统计: 命中次数、未命中次数、当前项数、容量上限、占用字节数'''
+        with self._lock:
+            nbytes = sum(v.nbytes for v in self._data.values())
+            return dict(hits=self.hits, misses=self.misses,
+                        size=len(self._data), maxsize=self.maxsize,
+                        nbytes=nbytes)
+
+    def clear(self):
+        '''清空缓存及统计'''
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def resize(self, maxsize):
+        '''修改容量上限，多出的项按LRU顺序丢弃'''
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
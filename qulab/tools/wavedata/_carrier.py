@@ -0,0 +1,40 @@
+import numpy as np
+from ._wavedata import as_dtype, get_default_dtype
+from ._cache import LRUCache
+
+'''Wavedata 载波表模块：复数载波 exp(1j*(w*t+phi)) 按 (角频率, 初相位, sRate, 精度) 缓存，
+不同长度共享同一张表，需要更长的载波时按原相位在表后延长'''
+
+# 载波表缓存，键为(w, phi, sRate, 精度)，缓存的数据只读共享
+carrier_cache = LRUCache(maxsize=64)
+
+
+def _table(w, phi, start, stop, sRate, dtype):
+    '''第start到stop-1点的载波，第k点对应时间(k+0.5)/sRate'''
+    t = (np.arange(start, stop)+0.5)/sRate
+    return as_dtype(np.exp(1j*(w*t+phi)), dtype)
+
+
+def carrier(w, phi=0, size=0, sRate=1e2, dtype=None):
+    '''返回size点的复数载波(只读数组)；
+    已缓存的表不够长时，只计算新增的点并按倍增延长，相位与原表连续；
+    dtype为None时使用默认精度'''
+    dtype = get_default_dtype() if dtype is None else np.finfo(dtype).dtype
+    key = (w, phi, sRate, dtype)
+    table = carrier_cache.get(key, lambda: _table(w, phi, 0, size, sRate, dtype))
+    n = len(table)
+    if n < size:
+        stop = max(size, 2*n)
+        table = np.concatenate([table, _table(w, phi, n, stop, sRate, dtype)])
+        carrier_cache.put(key, table)
+    return table[:size]
+
+
+def carrier_cache_info():
+    '''返回载波表缓存的统计信息'''
+    return carrier_cache.info()
+
+
+def clear_carrier_cache():
+    '''清空载波表缓存'''
+    carrier_cache.clear()
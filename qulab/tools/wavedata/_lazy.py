@@ -0,0 +1,155 @@
+import numpy as np
+from contextlib import contextmanager
+
+'''Wavedata 惰性求值模块：运算时只构建表达式树，读取data时一次性融合计算'''
+
+_LAZY = False
+
+
+def is_lazy():
+    '''当前是否处于惰性模式'''
+    return _LAZY
+
+
+def set_lazy(enable=True):
+    '''全局开启/关闭惰性模式，返回之前的状态'''
+    global _LAZY
+    old, _LAZY = _LAZY, bool(enable)
+    return old
+
+
+@contextmanager
+def lazy(enable=True):
+    '''with lazy(): 块内Wavedata的运算只构建表达式，读取data时才计算'''
+    old = set_lazy(enable)
+    try:
+        yield
+    finally:
+        set_lazy(old)
+
+
+def _result_dtype(op, *args):
+    '''用0长度数组试算，得到numpy运算结果的dtype；
+    标量节点用原来的数值参与试算，与直接运算的类型提升规则一致'''
+    _args = [a.value if isinstance(a, Scalar) else
+             np.empty(0, a.dtype) if isinstance(a, Node) else a for a in args]
+    return op(*_args).dtype
+
+
+class Node(object):
+    '''表达式节点基类，记录结果的点数size与类型dtype'''
+    size = 0
+    dtype = np.dtype(float)
+
+    def eval(self, out):
+        '''将结果写入out(长度为size，类型为dtype)'''
+        raise NotImplementedError
+
+
+class Leaf(Node):
+    '''叶节点，引用已有的数组(不复制)'''
+    def __init__(self, data):
+        self.data = data
+        self.size = len(data)
+        self.dtype = data.dtype
+
+    def eval(self, out):
+        out[...] = self.data
+
+
+class Scalar(Node):
+    '''标量节点，参与运算时直接广播'''
+    def __init__(self, value):
+        self.value = value
+        self.size = 0
+        self.dtype = np.asarray(value).dtype
+
+
+class Unary(Node):
+    '''一元运算节点，如 -w, abs(w), w**v'''
+    def __init__(self, op, child, *args):
+        self.op = op
+        self.child = child
+        self.args = args
+        self.size = child.size
+        self.dtype = _result_dtype(op, child, *args)
+
+    def eval(self, out):
+        if np.can_cast(self.child.dtype, out.dtype):
+            buf = out
+        else: # 类型改变(如复数取abs)，需要一个临时数组
+            buf = np.empty(self.child.size, self.child.dtype)
+        self.child.eval(buf)
+        self.op(buf, *self.args, out=out)
+
+
+class Binary(Node):
+    '''二元运算节点，长度不同时短的一方补0对齐，与Wavedata运算规则一致'''
+    # 与0运算结果不变的运算，补0部分无需计算
+    _identity_zero = (np.add, np.subtract)
+
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+        self.size = max(left.size, right.size)
+        self.dtype = _result_dtype(op, left, right)
+
+    @staticmethod
+    def _operand(node):
+        '''标量直接返回，叶节点返回原数组，其余子表达式写入临时数组'''
+        if isinstance(node, Scalar):
+            return node.value
+        if isinstance(node, Leaf):
+            return node.data
+        buf = np.empty(node.size, node.dtype)
+        node.eval(buf)
+        return buf
+
+    def eval(self, out):
+        op, left, right = self.op, self.left, self.right
+        if isinstance(left, Scalar):
+            # v op w 形式，先把右边写入out，再原位运算
+            right.eval(out)
+            op(left.value, out, out=out)
+            return
+        n = left.size
+        left.eval(out[:n])
+        out[n:] = 0
+        r = self._operand(right)
+        if isinstance(right, Scalar):
+            op(out, r, out=out)
+            return
+        m = right.size
+        op(out[:m], r, out=out[:m])
+        if m < self.size and op not in self._identity_zero:
+            op(out[m:], 0, out=out[m:])
+
+
+class Cast(Node):
+    '''类型转换节点，使惰性结果与直接计算时的精度策略一致'''
+    def __init__(self, child, dtype):
+        self.child = child
+        self.size = child.size
+        self.dtype = np.dtype(dtype)
+
+    def eval(self, out):
+        buf = np.empty(self.child.size, self.child.dtype)
+        self.child.eval(buf)
+        out[...] = buf
+
+
+def as_node(obj):
+    '''把Wavedata或标量转换为表达式节点'''
+    if isinstance(obj, Node):
+        return obj
+    if hasattr(obj, '_node'):
+        return obj._node()
+    return Scalar(obj)
+
+
+def evaluate(expr):
+    '''融合计算：只分配一个输出数组，所有运算原位完成'''
+    out = np.empty(expr.size, expr.dtype)
+    expr.eval(out)
+    return out
@@ -0,0 +1,164 @@
+import numpy as np
+from fractions import Fraction
+from scipy import signal
+from scipy.fftpack import next_fast_len
+
+'''Wavedata 重采样与分数延时模块，包含多相滤波、FFT带限等方法，均直接支持复数序列；
+Wavedata第k个点对应时间(k+0.5)/sRate，重采样都按这个时间对齐'''
+
+
+def out_size(size, sRate, new_sRate):
+    '''重采样后的点数，与Wavedata.init的取整方式一致'''
+    return int(np.around(size/sRate*new_sRate))
+
+
+def ratio(sRate, new_sRate, max_denominator=1000):
+    '''返回整数 (up, down)，使 new_sRate/sRate 约等于 up/down'''
+    r = (Fraction(new_sRate)/Fraction(sRate)).limit_denominator(max_denominator)
+    return r.numerator, r.denominator
+
+
+def resample_poly(data, sRate, new_sRate, max_denominator=1000,
+                  window=('kaiser', 5.0)):
+    '''多相滤波重采样：先按有理数 up/down 插值，再用低通FIR抗混叠后抽取'''
+    data = np.asarray(data)
+    size = out_size(len(data), sRate, new_sRate)
+    up, down = ratio(sRate, new_sRate, max_denominator)
+    # 在上采样网格中，输出第j点位于 j*down+(down-up)/2 处，
+    # 当 down-up 为奇数时将 up/down 同时加倍，使偏移为整数
+    if (down-up) % 2:
+        up, down = 2*up, 2*down
+    shift = (down-up)//2
+    max_rate = max(up, down)
+    half_len = 10*max_rate
+    h = signal.firwin(2*half_len+1, 1/max_rate, window=window)*up
+    # 滤波器延迟 half_len 与对齐偏移合并，前补0使其为down的整数倍
+    delay = half_len+shift
+    pre = (-delay) % down
+    h = np.append(np.zeros(pre), h)
+    start = (delay+pre)//down
+    y = signal.upfirdn(h, data, up, down)[start:start+size]
+    if len(y) < size:
+        y = np.append(y, np.zeros(size-len(y), y.dtype))
+    return y
+
+
+def resample_fft(data, sRate, new_sRate, max_denominator=1000):
+    '''FFT带限重采样：频域补0或截断，视序列为周期信号；
+    输入末尾补0到down的整数倍，保证变换前后时长严格对应'''
+    data = np.asarray(data)
+    size = out_size(len(data), sRate, new_sRate)
+    up, down = ratio(sRate, new_sRate, max_denominator)
+    n = -(-len(data)//down)*down
+    m = n//down*up
+    if n == 0 or m == 0:
+        return np.zeros(size, np.result_type(data, float))
+    if n > len(data):
+        data = np.append(data, np.zeros(n-len(data), data.dtype))
+    # 输出第j点对应输入的第 j*n/m+(n/m-1)/2 点，频域乘相位因子做对齐
+    tau = (n/m-1)/2
+    if np.iscomplexobj(data):
+        X = np.fft.fft(data)*np.exp(2j*np.pi*np.fft.fftfreq(n)*tau)
+        Y = np.zeros(m, X.dtype)
+        k = min(n, m)
+        p, q = (k+1)//2, (k-1)//2  # 保留的正频率(含0频)、负频率点数
+        Y[:p] = X[:p]
+        if q:
+            Y[m-q:] = X[n-q:]
+        if k % 2 == 0: # 保留带宽的边缘恰为奈奎斯特频率
+            if m > n:
+                Y[p] = Y[m-p] = X[p]/2
+            elif m < n:
+                Y[p] = X[p]+X[n-p]
+            else:
+                Y[p] = X[p]
+        y = np.fft.ifft(Y)*(m/n)
+    else:
+        X = np.fft.rfft(data)*np.exp(2j*np.pi*np.fft.rfftfreq(n)*tau)
+        if m > n and n % 2 == 0:
+            X[-1] /= 2 # 原奈奎斯特分量平分到正负频率
+        elif m < n and m % 2 == 0:
+            X[m//2] *= 2 # 新奈奎斯特分量为正负频率之和
+        y = np.fft.irfft(X, m)*(m/n)
+    y = y[:size]
+    if len(y) < size:
+        y = np.append(y, np.zeros(size-len(y), y.dtype))
+    return y
+
+
+def delay_len(n, d, d_Q=None):
+    '''分数延时时FFT的长度：末尾补0的点数比最大延时多16点'''
+    d_max = np.max(np.abs(d)) if d_Q is None else max(np.max(np.abs(d)), np.max(np.abs(d_Q)))
+    return next_fast_len(n+int(np.ceil(d_max))+16)
+
+
+def delay_fft(data, d, d_Q=None):
+    '''频域相位斜坡实现分数点延时，d为延时点数(可为小数，正数右移)；
+    给定d_Q时，实部/虚部分别延时d/d_Q，只需一对FFT；
+    末尾补0后再变换，避免首尾循环混叠，长度不变；
+    二维数组按最后一维(采样点)逐行延时，d/d_Q可以是 (记录数,1) 的数组'''
+    data = np.asarray(data)
+    n = data.shape[-1]
+    N = delay_len(n, d, d_Q)
+    if d_Q is None and not np.iscomplexobj(data):
+        X = np.fft.rfft(data, N)
+        X *= np.exp(-2j*np.pi*np.fft.rfftfreq(N)*d)
+        return np.fft.irfft(X, N)[..., :n]
+    f = np.fft.fftfreq(N)
+    Z = np.fft.fft(data, N)
+    if d_Q is None:
+        Z *= np.exp(-2j*np.pi*f*d)
+    else:
+        # 由共轭对称性分离实部和虚部的频谱，分别乘相位因子后再合并
+        Zc = np.conj(np.roll(Z[..., ::-1], 1, axis=-1))
+        Z = (Z+Zc)/2*np.exp(-2j*np.pi*f*d) + (Z-Zc)/2*np.exp(-2j*np.pi*f*d_Q)
+    return np.fft.ifft(Z)[..., :n]
+
+
+def phase_ramp(d, N):
+    '''延时d点的频域相位因子 exp(-2j*pi*fftfreq(N)*d)，沿最后一维；
+    d为形如 (...,1) 的数组时，把频率序号分解为 a*B+b，
+    只计算两组约sqrt(N)长的复指数再相乘，避免逐点计算复指数'''
+    if np.ndim(d) == 0:
+        return np.exp(-2j*np.pi*np.fft.fftfreq(N)*d)
+    shape = np.shape(d)[:-1]+(N,)
+    d = np.ravel(d)[:, None]
+    B = int(np.sqrt(N))+1
+    A = -(-N//B)
+    e_b = np.exp(-2j*np.pi*d*np.arange(B)/N)
+    e_a = np.exp(-2j*np.pi*d*(np.arange(A)*B)/N)
+    ph = (e_a[:, :, None]*e_b[:, None, :]).reshape(len(d), A*B)[:, :N]
+    ph[:, (N+1)//2:] *= np.exp(2j*np.pi*d) # 负频率部分
+    return ph.reshape(shape)
+
+
+def delay_fft_T(v, d, N):
+    '''复数FFT分数延时算子(FFT长度N)的转置作用在v上，沿最后一维；
+    用于把"延时后与v做内积"转换为"与delay_fft_T(v)做内积"'''
+    v = np.asarray(v)
+    n = v.shape[-1]
+    V = np.fft.ifft(v, N)*phase_ramp(d, N)
+    return np.fft.fft(V)[..., :n]
+
+
+def delay_fir(data, d, taps=32):
+    '''加窗sinc FIR实现分数点延时，d为延时点数(可为小数，正数右移)，长度不变'''
+    data = np.asarray(data)
+    n = len(data)
+    k = int(np.floor(d))
+    frac = d-k
+    # h(i) = sinc(i-frac)，i 取 -taps/2+1 ... taps/2，Blackman窗以 frac 为中心
+    i0 = -taps//2+1
+    x = np.arange(i0, i0+taps)-frac
+    T = taps+1
+    window = 0.42+0.5*np.cos(2*np.pi*x/T)+0.08*np.cos(4*np.pi*x/T)
+    h = np.sinc(x)*window
+    h /= h.sum()
+    c = np.convolve(data, h)
+    # y[j] = c[j-k-i0]
+    y = np.zeros(n, c.dtype)
+    start = -k-i0
+    lo, hi = max(0, -start), min(n, len(c)-start)
+    if hi > lo:
+        y[lo:hi] = c[lo+start:hi+start]
+    return y
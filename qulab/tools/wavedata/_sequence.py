@@ -0,0 +1,90 @@
+import numpy as np
+from ._wavedata import Wavedata
+
+'''Wavedata 序列构建模块：记录各段波形及其位置，最后一次性拼接'''
+
+
+class WaveSequence(object):
+    '''波形序列构建器；
+    append/| 依次串联，^ 重复，place 在指定时间叠加，
+    to_wavedata 预分配输出数组后一次性写入，总耗时与序列长度成线性'''
+
+    def __init__(self, sRate=1e2):
+        self.sRate = sRate
+        # 每段为 (起始点, 数据)
+        self._segments = []
+        self._dtype = None
+        self._cursor = 0  # 下一段串联的起始点
+        self._size = 0    # 总点数
+
+    @property
+    def size(self):
+        '''返回序列点数'''
+        return self._size
+
+    @property
+    def len(self):
+        '''返回序列长度'''
+        return self._size/self.sRate
+
+    def _add(self, offset, data):
+        self._segments.append((offset, data))
+        if self._dtype is None:
+            self._dtype = data.dtype
+        else:
+            self._dtype = np.result_type(self._dtype, data.dtype)
+        self._size = max(self._size, offset+len(data))
+
+    def append(self, wd):
+        '''在序列末尾串联一个波形，返回自身'''
+        assert isinstance(wd,Wavedata)
+        assert self.sRate == wd.sRate
+        data = wd.data
+        self._add(self._cursor, data)
+        self._cursor += len(data)
+        return self
+
+    def blank(self, width):
+        '''在序列末尾加入一段空白，不记录数据'''
+        n = np.around(abs(width)*self.sRate).astype(int)
+        self._cursor += n
+        self._size = max(self._size, self._cursor)
+        return self
+
+    def place(self, wd, t):
+        '''在时间t处叠加一个波形，不移动串联位置'''
+        assert isinstance(wd,Wavedata)
+        assert self.sRate == wd.sRate
+        offset = np.around(t*self.sRate).astype(int)
+        assert offset >= 0
+        self._add(offset, wd.data)
+        return self
+
+    def repeat(self, n):
+        '''将当前序列重复n次，只记录位置，不复制数据'''
+        n = int(n)
+        if n <= 1:
+            return self
+        period = self._cursor
+        segments = list(self._segments)
+        for i in range(1, n):
+            for offset, data in segments:
+                self._add(offset+i*period, data)
+        self._cursor = n*period
+        self._size = max(self._size, self._cursor)
+        return self
+
+    def __or__(self, wd):
+        '''seq|w 串联波形，注意会修改并返回自身'''
+        return self.append(wd)
+
+    def __xor__(self, n):
+        '''seq^n 重复n次，注意会修改并返回自身'''
+        return self.repeat(n)
+
+    def to_wavedata(self):
+        '''预分配输出数组，一次性写入各段，返回Wavedata'''
+        data = np.zeros(self._size, float if self._dtype is None else self._dtype)
+        for offset, d in self._segments:
+            data[offset:offset+len(d)] += d
+        return Wavedata(data, self.sRate)
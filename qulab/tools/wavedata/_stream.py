@@ -0,0 +1,76 @@
+import numpy as np
+from scipy import signal
+from ._wavedata import Wavedata, as_dtype, _SINGLE
+
+'''Wavedata 分块处理模块：配合 Wavedata.from_memmap/iter_chunks，
+对大于内存的波形逐块滤波、积分、计算功率谱，结果可直接写入memmap文件'''
+
+
+def _empty(size, sRate, dtype, path=None):
+    '''新建输出波形，给定path时输出到memmap文件，否则在内存中'''
+    if path is not None:
+        return Wavedata.from_memmap(path, 'w+', size, sRate, dtype)
+    return Wavedata._from_array(np.empty(size, dtype), sRate)
+
+
+def filter_chunks(wd, filter, chunk=2**20, overlap=4096, path=None):
+    '''逐块调用filter.process滤波，每块前后多取overlap点以消除边缘效应，
+    只保留中间部分写入输出；path不为None时输出为memmap文件；
+    filter为StreamFilter等带状态的流式滤波器时，块之间传递状态，不需要重叠'''
+    assert hasattr(filter,'process')
+    if hasattr(filter,'reset'):
+        filter.reset()
+        overlap = 0
+    dtype = wd.dtype if wd.dtype in _SINGLE else None
+    n = wd.size
+    out = None
+    for start in range(0, n, chunk):
+        lo, hi = max(0, start-overlap), min(n, start+chunk+overlap)
+        seg = np.asarray(wd.data[lo:hi])
+        res, sRate = filter.process(seg, wd.sRate)
+        assert sRate == wd.sRate
+        res = as_dtype(res, dtype)
+        if out is None:
+            out = _empty(n, wd.sRate, res.dtype, path)
+        stop = min(n, start+chunk)
+        out.data[start:stop] = res[start-lo:stop-lo]
+    if out is None:
+        out = _empty(0, wd.sRate, wd.dtype)
+    return out
+
+
+def integrate_chunks(wd, chunk=2**20, path=None):
+    '''逐块求积分，与Wavedata.integrate结果相同，块之间传递累积值'''
+    out = None
+    carry = 0
+    start = 0
+    for w in wd.iter_chunks(chunk):
+        res = np.cumsum(w.data)/wd.sRate+carry
+        if out is None:
+            out = _empty(wd.size, wd.sRate, res.dtype, path)
+        out.data[start:start+len(res)] = res
+        if len(res):
+            carry = res[-1]
+        start += len(res)
+    return out
+
+
+def psd_chunks(wd, nperseg=4096, noverlap=None, chunk=2**20, **kw):
+    '''逐块计算Welch功率谱密度，结果与对整段数据调用scipy.signal.welch相同；
+    每块包含整数个分段，块之间重叠noverlap点，使分段位置与整段计算一致；
+    返回 (频率, 功率谱密度)，kw传给scipy.signal.welch'''
+    noverlap = nperseg//2 if noverlap is None else noverlap
+    step = nperseg-noverlap
+    size = max(1, (chunk-noverlap)//step)*step+noverlap
+    kw.setdefault('return_onesided', not wd.isIQ)
+    total, count, f = 0, 0, None
+    for w in wd.iter_chunks(size, noverlap):
+        if w.size < nperseg:
+            break
+        nseg = (w.size-noverlap)//step
+        f, p = signal.welch(w.data, fs=wd.sRate, nperseg=nperseg,
+                            noverlap=noverlap, **kw)
+        total = total+p*nseg
+        count += nseg
+    assert count, 'waveform is shorter than nperseg !'
+    return f, total/count
@@ -1,9 +1,71 @@
 import numpy as np
-from ._wavedata import Wavedata
+from ._wavedata import Wavedata, _SINGLE
+from ._wavebatch import WaveBatch
+from ._carrier import carrier
 from ._wd_func import Exp,Sin,Cos
 
 '''Wavedata 虚拟IQ混频器模块'''
 
+
+def _cali_coef(cali_array=None, DEG=True):
+    '''把2x3的校准矩阵转换为 ((scale_i,offset_i,phi_i),(scale_q,offset_q,phi_q))，相位为弧度'''
+    if cali_array is None:
+        cali_array = [[1,0,0],
+                      [1,0,0]]
+    _cali_array = np.array(cali_array, dtype=float)
+    if DEG:
+        _cali_array[:,2] = _cali_array[:,2]*np.pi/180
+    return tuple(map(tuple, _cali_array))
+
+def _mix(iq, sRate, LO_freq, cali, cali_rf, out, tmp):
+    '''单通道上变频，结果写入out，tmp为同样大小的临时数组；
+    RF = scale_rf*((scale_i*I+offset_i)*cos(wt+phi_i)-(scale_q*Q+offset_q)*sin(wt+phi_q))+offset_rf
+    各系数先合并为标量，载波取自载波表，只在out和tmp上原地计算'''
+    (scale_i, offset_i, phi_i), (scale_q, offset_q, phi_q) = cali
+    scale_rf, offset_rf = cali_rf
+    w = 2*np.pi*LO_freq
+    size = out.shape[-1]
+    c = carrier(w, phi_i, size, sRate, out.dtype)
+    np.multiply(np.real(iq), scale_rf*scale_i, out=out)
+    out += scale_rf*offset_i
+    out *= c.real
+    if phi_q != phi_i:
+        c = carrier(w, phi_q, size, sRate, out.dtype)
+    np.multiply(np.imag(iq), scale_rf*scale_q, out=tmp)
+    tmp += scale_rf*offset_q
+    tmp *= c.imag
+    out -= tmp
+    if offset_rf:
+        out += offset_rf
+    return out
+
+def up_convert(IQ, LO_freq, cali_array=None, cali_rf=None, DEG=True, out=None):
+    '''融合的上变频：IQ振幅校准、相位校准、LO混频、RF校准一次完成，不产生中间波形；
+    IQ为Wavedata时返回Wavedata；
+    IQ为WaveBatch或Wavedata列表时为多通道，每条记录一个通道，返回WaveBatch，
+    此时LO_freq、cali_array(形状n*2*3)、cali_rf(形状n*2)可以按通道分别给出；
+    out为预分配的输出数组，形状与返回的data相同'''
+    if isinstance(IQ, (list, tuple)):
+        IQ = WaveBatch.from_wavedata(IQ)
+    data = np.asarray(IQ.data)
+    real = np.finfo(data.dtype).dtype if data.dtype in _SINGLE else np.dtype(float)
+    if out is None:
+        out = np.empty(data.shape, real)
+    assert out.shape == data.shape
+    if isinstance(IQ, Wavedata):
+        _mix(data, IQ.sRate, LO_freq, _cali_coef(cali_array, DEG),
+             (1,0) if cali_rf is None else cali_rf, out, np.empty_like(out))
+        return Wavedata._from_array(out, IQ.sRate)
+    n = data.shape[0]
+    LO_freq = np.broadcast_to(LO_freq, (n,))
+    cali_array = np.broadcast_to([[1,0,0],[1,0,0]] if cali_array is None else cali_array, (n,2,3))
+    cali_rf = np.broadcast_to([1,0] if cali_rf is None else cali_rf, (n,2))
+    tmp = np.empty_like(out[0])
+    for k in range(n):
+        _mix(data[k], IQ.sRate, LO_freq[k], _cali_coef(cali_array[k], DEG),
+             cali_rf[k], out[k], tmp)
+    return WaveBatch._from_array(out, IQ.sRate)
+
 class vIQmixer(object):
     '''virtual IQ mixer'''
 
@@ -11,8 +73,6 @@ class vIQmixer(object):
         self.LO_freq = None
         # _IQ 表示输入的IQ
         self._IQ = None
-        # __IQ 表示校准之后的IQ
-        self.__IQ = None
         self._cali_amp_I = (1,0)
         self._cali_amp_Q = (1,0)
         self._cali_phi = (0,0) #弧度
@@ -37,30 +97,21 @@ class vIQmixer(object):
         '''cali_array: 2x3 array ;
         两行分别代表I/Q的校准系数；
         三列分别代表I/Q的 振幅系数、振幅补偿、相位补偿(默认角度)'''
-        if cali_array is None:
-            cali_array = [[1,0,0],
-                          [1,0,0]]
-        _cali_array = np.array(cali_array)
-        self._cali_amp_I = _cali_array[0,:2]
-        self._cali_amp_Q = _cali_array[1,:2]
+        cali = _cali_coef(cali_array,DEG)
+        self._cali_amp_I = cali[0][:2]
+        self._cali_amp_Q = cali[1][:2]
         #转为弧度
-        self._cali_phi = _cali_array[:,2]*np.pi/180 if DEG else _cali_array[:,2]
-        self.__Cali_IQ()
+        self._cali_phi = (cali[0][2], cali[1][2])
         return self
 
-    def __Cali_IQ(self):
-        scale_i, offset_i = self._cali_amp_I
-        scale_q, offset_q = self._cali_amp_Q
-        __I = scale_i * self._IQ.I() + offset_i
-        __Q = scale_q * self._IQ.Q() + offset_q
-        self.__IQ = __I + 1j*__Q
-
-    def UpConversion(self):
-        '''需要先 set_IQ, set_LO, set_Cali, 再使用此方法'''
-        cali_phi_i, cali_phi_q = self._cali_phi
-        rf_wd = self.__IQ.I() * Cos(2*np.pi*self.LO_freq,cali_phi_i,self.len,self.sRate) - \
-                self.__IQ.Q() * Sin(2*np.pi*self.LO_freq,cali_phi_q,self.len,self.sRate)
-        self._RF = rf_wd
+    def UpConversion(self, cali_rf=None):
+        '''需要先 set_IQ, set_LO, set_Cali, 再使用此方法；
+        IQ校准与混频一次完成，给定cali_rf时同时做RF校准'''
+        if cali_rf is not None:
+            self._cali_rf = np.array(cali_rf)
+        cali = (tuple(self._cali_amp_I)+(self._cali_phi[0],),
+                tuple(self._cali_amp_Q)+(self._cali_phi[1],))
+        self._RF = up_convert(self._IQ, self.LO_freq, cali, cali_rf, DEG=False)
         return self
 
     def set_CaliRF(self, cali_rf=None):
@@ -70,15 +121,15 @@ class vIQmixer(object):
             cali_rf=[1,0]
         self._cali_rf=np.array(cali_rf)
         scale_rf, offset_rf = self._cali_rf
-        self._RF = scale_rf * self._RF + offset_rf
+        # _RF由UpConversion新建，可以原地校准
+        self._RF.data *= scale_rf
+        self._RF.data += offset_rf
         return self
 
     @classmethod
     def up_conversion(cls,LO_freq,I=0,Q=0,IQ=None,cali_array=None,cali_rf=None):
         '''快速配置并上变频'''
-        vIQ=cls().set_LO(LO_freq).set_IQ(I,Q,IQ).set_Cali(cali_array).UpConversion()
-        if cali_rf is not None:
-            vIQ.set_CaliRF(cali_rf)
+        vIQ=cls().set_LO(LO_freq).set_IQ(I,Q,IQ).set_Cali(cali_array).UpConversion(cali_rf)
         return vIQ._RF
 
     @classmethod
@@ -104,15 +155,12 @@ class vIQmixer(object):
             shift_I = _phi_I/abs(2*np.pi*carry_freq) if not carry_freq==0 else 0
             shift_Q = _phi_Q/abs(2*np.pi*carry_freq) if not carry_freq==0 else 0
 
-            # 相位校准，将原插值函数平移后重新采样
-            func_I = lambda x: carry_IQ.I().timeFunc(kind='cubic')(x+shift_I)
-            carry_I = Wavedata.init(func_I,(0,IQ.len),IQ.sRate)
-            func_Q = lambda x: carry_IQ.Q().timeFunc(kind='cubic')(x+shift_Q)
-            carry_Q = Wavedata.init(func_Q,(0,IQ.len),IQ.sRate)
+            # 相位校准，I/Q分别做分数延时(一对FFT)，时移与Homodyne中相反
+            carry_IQ = carry_IQ.delay(-shift_I, -shift_Q)
 
             # 进行振幅校准
-            carry_I = carry_I*_scale_I+_offset_I
-            carry_Q = carry_Q*_scale_Q+_offset_Q
+            carry_I = carry_IQ.I()*_scale_I+_offset_I
+            carry_Q = carry_IQ.Q()*_scale_Q+_offset_Q
 
             carry_IQ=carry_I+1j*carry_Q
             return carry_IQ
\ No newline at end of file
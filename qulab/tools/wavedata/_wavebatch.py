@@ -0,0 +1,243 @@
+import numpy as np
+from scipy.fftpack import fft
+from ._wavedata import Wavedata, spectrum_mode, dft_bins, as_dtype, _SINGLE
+from . import _resample
+
+'''Wavedata 批量模块：WaveBatch 保存 (记录数 x 采样点数) 的二维数组，
+所有记录共享同一个采样率，运算都沿采样点方向向量化完成'''
+
+
+def _align_op(op, a, b):
+    '''沿最后一维对齐后逐点运算，短的一方视为补0，不修改输入'''
+    n, m = a.shape[-1], b.shape[-1]
+    if n == m:
+        return op(a, b)
+    size = max(n, m)
+    shape = np.broadcast(a[..., :0], b[..., :0]).shape[:-1]+(size,)
+    out = np.zeros(shape, np.result_type(a, b, op(a[..., :0], b[..., :0])))
+    out[..., :n] = a
+    op(out[..., :m], b, out=out[..., :m])
+    if m < size and op not in (np.add, np.subtract):
+        op(out[..., m:], 0, out=out[..., m:])
+    return out
+
+
+class WaveBatch(object):
+    '''多条记录的波形，data 为 (记录数, 采样点数) 的二维数组'''
+    # 与numpy数组运算时，交给WaveBatch的反向运算处理
+    __array_ufunc__ = None
+
+    def __init__(self, data=[], sRate=1, dtype=None):
+        '''给定二维序列和采样率，构造WaveBatch；dtype 参考Wavedata'''
+        self.data = np.atleast_2d(as_dtype(data, dtype, copy=True))
+        self.sRate = sRate
+
+    @classmethod
+    def _from_array(cls, data, sRate):
+        '''直接引用已有的二维数组构造WaveBatch，不复制'''
+        w = cls.__new__(cls)
+        w.data = data
+        w.sRate = sRate
+        return w
+
+    def _keep_dtype(self):
+        '''单精度时返回其dtype，使计算结果保持单精度'''
+        return self.dtype if self.dtype in _SINGLE else None
+
+    def _new(self, data, sRate=None):
+        '''由计算结果构造新的WaveBatch，单精度的结果保持单精度'''
+        sRate = self.sRate if sRate is None else sRate
+        return self.__class__(data, sRate, self._keep_dtype())
+
+    @classmethod
+    def from_wavedata(cls, wd_list):
+        '''由多个等长、等采样率的Wavedata构造WaveBatch'''
+        wd_list = list(wd_list)
+        sRate = wd_list[0].sRate
+        assert all(wd.sRate == sRate for wd in wd_list)
+        return cls(np.stack([wd.data for wd in wd_list]), sRate)
+
+    @property
+    def dtype(self):
+        '''data的数据类型'''
+        return self.data.dtype
+
+    @property
+    def isIQ(self):
+        '''是否为IQ类型 即data是否为复数类型'''
+        return np.iscomplexobj(self.data)
+
+    @property
+    def records(self):
+        '''返回记录条数'''
+        return self.data.shape[0]
+
+    @property
+    def size(self):
+        '''返回每条记录的点数'''
+        return self.data.shape[-1]
+
+    @property
+    def len(self):
+        '''返回每条记录的波形长度'''
+        return self.size/self.sRate
+
+    @property
+    def x(self):
+        '''返回波形的时间列表'''
+        dt = 1/self.sRate
+        return np.arange(dt/2, self.len, dt)
+
+    @property
+    def real(self):
+        '''data实部'''
+        return np.real(self.data)
+
+    @property
+    def imag(self):
+        '''data虚部'''
+        return np.imag(self.data)
+
+    def __len__(self):
+        return self.records
+
+    def __getitem__(self, idx):
+        '''整数索引返回对应记录的Wavedata，切片返回WaveBatch'''
+        data = self.data[idx]
+        if data.ndim == 1:
+            return Wavedata(data, self.sRate, self._keep_dtype())
+        return self._new(data)
+
+    def __iter__(self):
+        for idx in range(self.records):
+            yield self[idx]
+
+    def I(self):
+        '''I波形 返回WaveBatch类'''
+        return self._new(np.real(self.data))
+
+    def Q(self):
+        '''Q波形 返回WaveBatch类'''
+        return self._new(np.imag(self.data))
+
+    def mean(self):
+        '''所有记录的平均，返回Wavedata类'''
+        return Wavedata(self.data.mean(axis=0), self.sRate, self._keep_dtype())
+
+    def _operand(self, other):
+        '''把另一个操作数转换为可以与data直接运算的数组或标量'''
+        if isinstance(other, (WaveBatch, Wavedata)):
+            assert self.sRate == other.sRate
+            return np.atleast_2d(other.data)
+        return other
+
+    def _binary(self, op, other, reflect=False):
+        o = self._operand(other)
+        if isinstance(other, (WaveBatch, Wavedata)):
+            a, b = (o, self.data) if reflect else (self.data, o)
+            data = _align_op(op, a, b)
+        else:
+            data = op(o, self.data) if reflect else op(self.data, o)
+        return self._new(data)
+
+    def __pos__(self):
+        '''正 +w'''
+        return self
+
+    def __neg__(self):
+        '''负 -w'''
+        return self._new(-self.data)
+
+    def __abs__(self):
+        '''绝对值 abs(w)'''
+        return self._new(np.abs(self.data))
+
+    def __pow__(self, v):
+        '''幂 w**v 波形值的v次幂'''
+        return self._new(self.data ** v)
+
+    def __add__(self, other):
+        '''加 w+o，o可以是WaveBatch、Wavedata(每条记录都加)、数组或标量；
+        数组按numpy规则广播，每条记录一个值时用 (记录数,1) 的形状'''
+        return self._binary(np.add, other)
+
+    def __radd__(self, other):
+        return self._binary(np.add, other, reflect=True)
+
+    def __sub__(self, other):
+        '''减 w-o'''
+        return self._binary(np.subtract, other)
+
+    def __rsub__(self, other):
+        return self._binary(np.subtract, other, reflect=True)
+
+    def __mul__(self, other):
+        '''乘 w*o'''
+        return self._binary(np.multiply, other)
+
+    def __rmul__(self, other):
+        return self._binary(np.multiply, other, reflect=True)
+
+    def __truediv__(self, other):
+        '''除 w/o'''
+        return self._binary(np.true_divide, other)
+
+    def __rtruediv__(self, other):
+        return self._binary(np.true_divide, other, reflect=True)
+
+    def FFT(self, mode='complex', half=True, **kw):
+        '''逐条记录FFT，规则与Wavedata.FFT相同'''
+        sRate = self.size/self.sRate
+        if half and not self.isIQ:
+            fft_data = np.fft.rfft(self.data, axis=-1)/self.size
+        else:
+            fft_data = fft(self.data, axis=-1)/self.size
+        data = spectrum_mode(fft_data, mode)
+        if half:
+            index = int((self.size+1)/2)
+            data = data[:, :index]
+            data[:, 1:] = data[:, 1:]*2 #非0频成分乘2
+        return self._new(data, sRate)
+
+    def getFFT(self, freq, mode='complex', half=True, method='auto', **kw):
+        '''获取指定频率的FFT分量，返回 (记录数, 频率数) 的数组；
+        method 参考Wavedata.getFFT'''
+        freq_array = np.array(freq)
+        if method == 'auto':
+            method = 'dft' if freq_array.size < np.log2(max(self.size,2)) else 'fft'
+        if method == 'fft':
+            fft_w = self.FFT(mode=mode, half=half, **kw)
+            index_freq = np.around(freq_array*fft_w.sRate).astype(int)
+            return fft_w.data[:, index_freq]
+        index_freq = np.around(freq_array*self.size/self.sRate).astype(int)
+        res_array = spectrum_mode(dft_bins(self.data, index_freq)/self.size, mode)
+        if half:
+            res_array = np.where(index_freq > 0, res_array*2, res_array) #非0频成分乘2
+        return res_array
+
+    def derivative(self):
+        '''逐条记录求导，点数不变'''
+        y = np.pad(self.data, ((0,0),(1,1)), 'constant')
+        diff_data = (y[:, 2:]-y[:, :-2])/2 #差分数据，间隔1个点做差分
+        return self._new(diff_data*self.sRate)
+
+    def integrate(self):
+        '''逐条记录求积分，点数不变'''
+        data = np.cumsum(self.data, axis=-1)/self.sRate
+        return self._new(data)
+
+    def delay(self, t, t_Q=None):
+        '''逐条记录分数延时，参考Wavedata.delay'''
+        d_Q = None if t_Q is None else t_Q*self.sRate
+        data = _resample.delay_fft(self.data, t*self.sRate, d_Q)
+        return self._new(data)
+
+    def process(self, func, **kw):
+        '''处理，func输入输出都是(data,sRate)格式，需支持二维data(沿最后一维处理)'''
+        data, sRate = func(self.data, self.sRate, **kw)
+        return self._new(data, sRate)
+
+    def filter(self, filter):
+        '''调用filter的process函数处理，baFilter等沿采样点方向逐行滤波'''
+        assert hasattr(filter,'process')
+        return self.process(filter.process)
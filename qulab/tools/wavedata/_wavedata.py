@@ -1,16 +1,158 @@
+import json
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy import interpolate
 from scipy.fftpack import fft,ifft
+from . import _lazy
+from . import _resample
+
+
+# 默认精度，None表示不转换(numpy默认双精度)，设为np.float32则统一使用单精度
+_default_dtype = None
+_SINGLE = (np.dtype(np.float32), np.dtype(np.complex64))
+
+def set_default_dtype(dtype=None):
+    '''设置Wavedata的默认精度，返回之前的设置；
+    dtype: None 不转换, np.float32 单精度, np.float64 双精度；
+    实数数据转为该精度的实数类型，复数数据转为对应精度的复数类型'''
+    global _default_dtype
+    old = _default_dtype
+    _default_dtype = None if dtype is None else np.dtype(dtype)
+    return old
+
+def get_default_dtype():
+    '''返回Wavedata的默认精度'''
+    return _default_dtype
+
+def as_dtype(data, dtype=None, copy=False):
+    '''按精度策略转换数组类型，保持实数/复数不变；
+    dtype为None时使用默认精度，默认精度也为None时不转换'''
+    if dtype is None:
+        dtype = _default_dtype
+    data = np.array(data) if copy else np.asarray(data)
+    if dtype is None:
+        return data
+    real = np.finfo(dtype).dtype
+    if np.iscomplexobj(data):
+        target = np.promote_types(real, np.complex64)
+    else:
+        target = real
+    return data.astype(target, copy=False)
+
+
+def spectrum_mode(fft_data, mode='complex'):
+    '''把复数频谱转换为mode对应的格式: amp/abs, phase/angle, real, imag, complex'''
+    if mode in ['amp','abs']:
+        return np.abs(fft_data)
+    elif mode in ['phase','angle']:
+        return np.angle(fft_data,deg=True)
+    elif mode == 'real':
+        return np.real(fft_data)
+    elif mode == 'imag':
+        return np.imag(fft_data)
+    elif mode == 'complex':
+        return fft_data
+
+
+def dft_bins(data, index):
+    '''只计算指定序号的DFT分量(未归一化)，沿最后一维计算，不生成完整频谱；
+    把序列排成 R x B 的矩阵，n = r*B+m，旋转因子分解为两部分的乘积，
+    只需计算 O(sqrt(N)*k) 个复指数和一次矩阵乘法'''
+    data = np.asarray(data)
+    index = np.asarray(index)
+    k = index.ravel()
+    N = data.shape[-1]
+    B = max(int(np.sqrt(N)), 1)
+    R = N//B
+    e1 = np.exp(-2j*np.pi*np.outer(np.arange(B), k)/N)
+    e2 = np.exp(-2j*np.pi*np.outer(np.arange(R)*B, k)/N)
+    main = data[..., :R*B].reshape(data.shape[:-1]+(R, B))
+    if np.iscomplexobj(data):
+        part = np.dot(main, e1)
+    else: # 实数序列分别与实部、虚部相乘，避免转换为复数
+        part = np.dot(main, e1.real)+1j*np.dot(main, e1.imag)
+    res = (part*e2).sum(axis=-2)
+    if R*B < N: # 剩余不足一行的点
+        e3 = np.exp(-2j*np.pi*np.outer(np.arange(R*B, N), k)/N)
+        res = res+np.dot(data[..., R*B:], e3)
+    return res.reshape(data.shape[:-1]+index.shape)
 
 
 class Wavedata(object):
-
-    def __init__(self, data = [], sRate = 1):
-        '''给定序列和采样率，构造Wavedata'''
-        self.data = np.array(data)
+    # 数据保存在_data中，惰性波形的表达式保存在_expr中
+    _data = None
+    _expr = None
+
+    def __init__(self, data = [], sRate = 1, dtype = None):
+        '''给定序列和采样率，构造Wavedata；
+        dtype 指定精度(如np.float32)，None时使用模块的默认精度'''
+        self.data = as_dtype(data, dtype, copy=True)
         self.sRate = sRate
 
+    def __setstate__(self, state):
+        '''兼容旧版本pickle保存的波形，旧版本的数据保存在'data'中'''
+        state = dict(state)
+        if 'data' in state:
+            state['_data'] = state.pop('data')
+            state['_expr'] = None
+        self.__dict__.update(state)
+
+    def _keep_dtype(self):
+        '''单精度时返回其dtype，使计算结果保持单精度'''
+        return self.dtype if self.dtype in _SINGLE else None
+
+    def _new(self, data, sRate=None):
+        '''由计算结果构造新波形，单精度波形的结果保持单精度'''
+        dtype = self._keep_dtype()
+        sRate = self.sRate if sRate is None else sRate
+        return self.__class__(data, sRate, dtype)
+
+    @classmethod
+    def _from_array(cls, data, sRate):
+        '''直接引用已有数组构造Wavedata，不复制(用于共享的缓存数据)'''
+        w = cls.__new__(cls)
+        w.data = data
+        w.sRate = sRate
+        return w
+
+    @classmethod
+    def _from_expr(cls, expr, sRate, dtype=None):
+        '''由表达式构造惰性Wavedata，读取data时才计算；
+        dtype与_new相同，按as_dtype的精度策略确定结果类型'''
+        target = as_dtype(np.empty(0, expr.dtype), dtype).dtype
+        if target != expr.dtype:
+            expr = _lazy.Cast(expr, target)
+        w = cls.__new__(cls)
+        w._data = None
+        w._expr = expr
+        w.sRate = sRate
+        return w
+
+    def _node(self):
+        '''返回对应的表达式节点'''
+        if self._expr is not None:
+            return self._expr
+        return _lazy.Leaf(self._data)
+
+    def _is_lazy(self, other=None):
+        '''运算是否应构建表达式: 惰性模式开启或有操作数尚未计算'''
+        if _lazy.is_lazy() or self._expr is not None:
+            return True
+        return isinstance(other,Wavedata) and other._expr is not None
+
+    @property
+    def data(self):
+        '''波形序列，惰性波形在第一次读取时融合计算'''
+        if self._expr is not None:
+            self._data = _lazy.evaluate(self._expr)
+            self._expr = None
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._expr = None
+
     @staticmethod
     def generateData(timeFunc, domain=(0,1), sRate=1e2):
         '''给定函数、定义域、采样率，生成data序列'''
@@ -28,10 +170,55 @@ class Wavedata(object):
         data = cls.generateData(timeFunc,domain,sRate)
         return cls(data,sRate)
 
+    @classmethod
+    def from_memmap(cls, path, mode='r', size=None, sRate=None, dtype=float):
+        '''由磁盘文件path构造Wavedata，数据为np.memmap，不整体读入内存；
+        sRate、数据类型等信息保存在 path+'.json' 中；
+        mode='w+' 时新建文件，需要给出 size、sRate 和 dtype'''
+        if mode == 'w+':
+            header = dict(sRate=sRate, dtype=np.dtype(dtype).str, size=int(size),
+                          isIQ=bool(np.issubdtype(dtype, np.complexfloating)))
+            with open(path+'.json', 'w') as f:
+                json.dump(header, f)
+        else:
+            with open(path+'.json') as f:
+                header = json.load(f)
+        data = np.memmap(path, dtype=np.dtype(header['dtype']), mode=mode,
+                         shape=(header['size'],))
+        return cls._from_array(data, header['sRate'])
+
+    def to_memmap(self, path, chunk=2**20):
+        '''把波形按块写入磁盘文件path，返回以该文件为数据的Wavedata'''
+        w = self.from_memmap(path, 'w+', self.size, self.sRate, self.dtype)
+        for start in range(0, self.size, chunk):
+            w.data[start:start+chunk] = self.data[start:start+chunk]
+        w.data.flush()
+        return w
+
+    def iter_chunks(self, size, overlap=0):
+        '''按块遍历波形，每块size点(最后一块可能较短)，相邻块重叠overlap点；
+        每块是引用原数据的Wavedata，对memmap数据只读取当前块'''
+        size, overlap = int(size), int(overlap)
+        assert 0 <= overlap < size
+        data = self.data
+        start = 0
+        while True:
+            yield self._from_array(np.asarray(data[start:start+size]), self.sRate)
+            if start+size >= len(data):
+                break
+            start += size-overlap
+
+    @property
+    def dtype(self):
+        '''data的数据类型，惰性波形不需要计算'''
+        if self._expr is not None:
+            return self._expr.dtype
+        return self.data.dtype
+
     @property
     def isIQ(self):
-        '''是否为IQ类型 即data是否包含复数'''
-        return np.any(np.iscomplex(self.data))
+        '''是否为IQ类型 即data是否为复数类型'''
+        return np.issubdtype(self.dtype, np.complexfloating)
 
     @property
     def x(self):
@@ -65,17 +252,19 @@ class Wavedata(object):
     @property
     def size(self):
         '''返回波形点数'''
+        if self._expr is not None:
+            return self._expr.size
         size = len(self.data)
         return size
 
     def I(self):
         '''I波形 返回Wavedata类'''
-        w = self.__class__(np.real(self.data), self.sRate)
+        w = self._new(np.real(self.data))
         return w
 
     def Q(self):
         '''Q波形 返回Wavedata类'''
-        w = self.__class__(np.imag(self.data), self.sRate)
+        w = self._new(np.imag(self.data))
         return w
 
     def trans(self,mode='real'):
@@ -92,7 +281,7 @@ class Wavedata(object):
             data = np.conj(self.data)
         elif mode == 'exchange': #交换实部和虚部
             data = 1j*np.conj(self.data)
-        w = self.__class__(data, self.sRate)
+        w = self._new(data)
         return w
 
     def timeFunc(self,kind='cubic'):
@@ -141,12 +330,16 @@ class Wavedata(object):
 
     def __neg__(self):
         '''负 -w'''
-        w = self.__class__(-self.data, self.sRate)
+        if self._is_lazy():
+            return self._from_expr(_lazy.Unary(np.negative, self._node()), self.sRate, self._keep_dtype())
+        w = self._new(-self.data)
         return w
 
     def __abs__(self):
         '''绝对值 abs(w)'''
-        w = self.__class__(np.abs(self.data), self.sRate)
+        if self._is_lazy():
+            return self._from_expr(_lazy.Unary(np.abs, self._node()), self.sRate, self._keep_dtype())
+        w = self._new(np.abs(self.data))
         return w
 
     def __rshift__(self, t):
@@ -160,7 +353,7 @@ class Wavedata(object):
             data = np.append(shift_data, self.data[:left_n])
         else:
             data = np.append(self.data[-left_n:], shift_data)
-        w = self.__class__(data, self.sRate)
+        w = self._new(data)
         return w
 
     def __lshift__(self, t):
@@ -172,7 +365,7 @@ class Wavedata(object):
         assert isinstance(other,Wavedata)
         assert self.sRate == other.sRate
         data = np.append(self.data,other.data)
-        w = self.__class__(data, self.sRate)
+        w = self._new(data)
         return w
 
     def __xor__(self, n):
@@ -182,36 +375,47 @@ class Wavedata(object):
             return self
         else:
             data = list(self.data)*n
-            w = self.__class__(data, self.sRate)
+            w = self._new(data)
             return w
 
     def __pow__(self, v):
         '''幂 w**v 波形值的v次幂'''
+        if self._is_lazy():
+            return self._from_expr(_lazy.Unary(np.power, self._node(), v), self.sRate, self._keep_dtype())
         data = self.data ** v
-        w = self.__class__(data, self.sRate)
+        w = self._new(data)
+        return w
+
+    def _binary(self, op, other):
+        '''两个波形逐点运算；长度不同时按最长的输出，短的一方视为补0，
+        结果直接写入一个新的输出数组，不修改、不复制两个输入波形'''
+        assert self.sRate == other.sRate
+        expr = _lazy.Binary(op, self._node(), other._node())
+        w = self._from_expr(expr, self.sRate, self._keep_dtype())
+        if not self._is_lazy(other):
+            w.data # 非惰性模式立即计算
         return w
 
     def __add__(self, other):
         '''加 w+o 波形值相加，会根据类型判断'''
         if isinstance(other,Wavedata):
-            assert self.sRate == other.sRate
-            size = max(self.size, other.size)
-            self.setSize(size)
-            other.setSize(size)
-            data = self.data + other.data
-            w = self.__class__(data, self.sRate)
-            return w
+            return self._binary(np.add, other)
         else:
             return other + self
 
     def __radd__(self, v):
         '''加 v+w 波形值加v，会根据类型判断'''
+        if self._is_lazy():
+            expr = _lazy.Binary(np.add, self._node(), _lazy.Scalar(v))
+            return self._from_expr(expr, self.sRate, self._keep_dtype())
         data = self.data +v
-        w = self.__class__(data, self.sRate)
+        w = self._new(data)
         return w
 
     def __sub__(self, other):
         '''减 w-o 波形值相减，会根据类型判断'''
+        if isinstance(other,Wavedata):
+            return self._binary(np.subtract, other)
         return self + (- other)
 
     def __rsub__(self, v):
@@ -221,39 +425,33 @@ class Wavedata(object):
     def __mul__(self, other):
         '''乘 w*o 波形值相乘，会根据类型判断'''
         if isinstance(other,Wavedata):
-            assert self.sRate == other.sRate
-            size = max(self.size, other.size)
-            self.setSize(size)
-            other.setSize(size)
-            data = self.data * other.data
-            w = self.__class__(data, self.sRate)
-            return w
+            return self._binary(np.multiply, other)
         else:
             return other * self
 
     def __rmul__(self, v):
         '''乘 v*w 波形值相乘，会根据类型判断'''
+        if self._is_lazy():
+            expr = _lazy.Binary(np.multiply, self._node(), _lazy.Scalar(v))
+            return self._from_expr(expr, self.sRate, self._keep_dtype())
         data = self.data * v
-        w = self.__class__(data, self.sRate)
+        w = self._new(data)
         return w
 
     def __truediv__(self, other):
         '''除 w/o 波形值相除，会根据类型判断'''
         if isinstance(other,Wavedata):
-            assert self.sRate == other.sRate
-            size = max(self.size, other.size)
-            self.setSize(size)
-            other.setSize(size)
-            data = self.data / other.data
-            w = self.__class__(data, self.sRate)
-            return w
+            return self._binary(np.true_divide, other)
         else:
             return (1/other) * self
 
     def __rtruediv__(self, v):
         '''除 v/w 波形值相除，会根据类型判断'''
+        if self._is_lazy():
+            expr = _lazy.Binary(np.true_divide, _lazy.Scalar(v), self._node())
+            return self._from_expr(expr, self.sRate, self._keep_dtype())
         data = v / self.data
-        w = self.__class__(data, self.sRate)
+        w = self._new(data)
         return w
 
     def convolve(self, other, mode='same', norm=True):
@@ -269,7 +467,7 @@ class Wavedata(object):
         else:
             kernal = _kernal
         data = np.convolve(self.data,kernal,mode)
-        w = self.__class__(data, self.sRate)
+        w = self._new(data)
         return w
 
     def FFT(self, mode='complex', half=True, **kw): # 支持复数，需做调整
@@ -279,35 +477,40 @@ class Wavedata(object):
         # 对于双边谱，即包含负频率成分的，除以size N 得到实际振幅
         # 对于单边谱，即不包含负频成分，实际振幅是正负频振幅的和，
         # 所以除了0频成分其他需要再乘以2
-        fft_data = fft(self.data)/self.size
-        if mode in ['amp','abs']:
-            data = np.abs(fft_data)
-        elif mode in ['phase','angle']:
-            data = np.angle(fft_data,deg=True)
-        elif mode == 'real':
-            data = np.real(fft_data)
-        elif mode == 'imag':
-            data = np.imag(fft_data)
-        elif mode == 'complex':
-            data = fft_data
+        if half and not np.iscomplexobj(self.data):
+            # 实数序列只需计算非负频率部分
+            fft_data = np.fft.rfft(self.data)/self.size
+        else:
+            fft_data = fft(self.data)/self.size
+        data = spectrum_mode(fft_data, mode)
         if half:
             #size N为偶数时，取N/2；为奇数时，取(N+1)/2
-            index = int((len(data)+1)/2)
+            index = int((self.size+1)/2)
             data = data[:index]
             data[1:] = data[1:]*2 #非0频成分乘2
-        w = self.__class__(data, sRate)
+        w = self._new(data, sRate)
         return w
 
-    def getFFT(self,freq,mode='complex',half=True,**kw):
+    def getFFT(self,freq,mode='complex',half=True,method='auto',**kw):
         ''' 获取指定频率的FFT分量；
         freq: 为一个频率值或者频率的列表，
+        method: fft 计算全部频谱后取值, dft 只对指定频率做DFT投影(O(N*k))，
+                auto 在频率个数少于log2(N)时使用dft，
         返回值: 是对应mode的一个值或列表'''
         freq_array=np.array(freq)
-        fft_w = self.FFT(mode=mode,half=half,**kw)
-        index_freq = np.around(freq_array*fft_w.sRate).astype(int)
-        res_array = fft_w.data[index_freq]
-        return res_array
-    
+        if method == 'auto':
+            method = 'dft' if freq_array.size < np.log2(max(self.size,2)) else 'fft'
+        if method == 'fft':
+            fft_w = self.FFT(mode=mode,half=half,**kw)
+            index_freq = np.around(freq_array*fft_w.sRate).astype(int)
+            res_array = fft_w.data[index_freq]
+            return res_array
+        index_freq = np.around(freq_array*self.size/self.sRate).astype(int)
+        res_array = spectrum_mode(dft_bins(self.data, index_freq)/self.size, mode)
+        if half:
+            res_array = np.where(index_freq > 0, res_array*2, res_array) #非0频成分乘2
+        return res_array[()] if res_array.ndim == 0 else res_array
+
     def transfer_wd(self,transfer_func,**kw):
         # transfer_func example
         # transfer_func = lambda w: 1+1j*0.01*w/(1j*w+1e9/10)
@@ -349,15 +552,40 @@ class Wavedata(object):
         w = self.init(timeFunc,domain,sRate)
         return w
 
-    def resample(self,sRate): # 复数支持与timeFunc一致
-        '''改变采样率重新采样'''
+    def resample(self,sRate,mode='interp',**kw): # 复数支持与timeFunc一致
+        '''改变采样率重新采样
+        mode: interp 插值(原方法), poly 有理数比例多相滤波, fft 频域带限重采样；
+        poly/fft 直接处理复数，kw传给对应函数(如max_denominator)'''
         if sRate == self.sRate:
             return self
+        if mode == 'poly':
+            data = _resample.resample_poly(self.data,self.sRate,sRate,**kw)
+            return self._new(data, sRate)
+        elif mode == 'fft':
+            data = _resample.resample_fft(self.data,self.sRate,sRate,**kw)
+            return self._new(data, sRate)
         elif sRate > self.sRate:
             return self.high_resample(sRate)
         elif sRate < self.sRate:
             return self.low_resample(sRate)
 
+    def delay(self, t, t_Q=None, mode='fft', **kw):
+        '''分数延时 长度不变，t为延时时间(正数右移)，可小于采样间隔；
+        给定t_Q时，I/Q分别延时t/t_Q；
+        mode: fft 频域相位斜坡, fir 加窗sinc卷积(kw可传taps)'''
+        d = t*self.sRate
+        if mode == 'fft':
+            d_Q = None if t_Q is None else t_Q*self.sRate
+            data = _resample.delay_fft(self.data, d, d_Q)
+        elif mode == 'fir':
+            if t_Q is None:
+                data = _resample.delay_fir(self.data, d, **kw)
+            else:
+                data = _resample.delay_fir(np.real(self.data), d, **kw) + \
+                       1j*_resample.delay_fir(np.imag(self.data), t_Q*self.sRate, **kw)
+        w = self._new(data)
+        return w
+
     def normalize(self):
         '''归一化 取实部和虚部绝对值的最大值进行归一，使分布在(-1,+1)'''
         v_max = max(abs(np.append(np.real(self.data),np.imag(self.data))))
@@ -370,20 +598,20 @@ class Wavedata(object):
         y2=np.append(self.data[1:],0)
         diff_data = (y2-y1)/2 #差分数据，间隔1个点做差分
         data = diff_data*self.sRate #导数，差分值除以 dt
-        w = self.__class__(data,self.sRate)
+        w = self._new(data)
         return w
 
     def integrate(self):
         '''求积分，点数不变'''
         cumsum_data = np.cumsum(self.data) #累积
         data = cumsum_data/self.sRate #积分，累积值乘以 dt
-        w = self.__class__(data,self.sRate)
+        w = self._new(data)
         return w
 
     def process(self,func,**kw): # 根据具体情况确定是否支持复数
         '''处理，传入一个处理函数func, 输入输出都是(data,sRate)格式'''
         data,sRate = func(self.data,self.sRate,**kw) # 接受额外的参数传递给func
-        return self.__class__(data,sRate)
+        return self._new(data, sRate)
 
     def filter(self,filter): # 根据具体情况确定是否支持复数
         '''调用filter的process函数处理；
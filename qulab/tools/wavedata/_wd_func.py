@@ -2,24 +2,51 @@ import numpy as np
 from scipy import interpolate
 from scipy.signal import chirp,sweep_poly
 # import matplotlib.pyplot as plt
-from ._wavedata import Wavedata
+from ._wavedata import Wavedata, as_dtype, get_default_dtype
+from ._cache import LRUCache
+from ._carrier import carrier, carrier_cache_info, clear_carrier_cache
+
+__all__ = ['Sin', 'Cos', 'Exp', 'Blank', 'Noise_wgn', 'DC', 'Triangle', 'Gaussian',
+           'Gaussian2', 'CosPulse', 'Sinc', 'Interpolation', 'Chirp', 'Sweep_poly',
+           'DRAGpulse', 'DRAG_wd', 'pulse_cache_info', 'clear_pulse_cache',
+           'carrier_cache_info', 'clear_carrier_cache']
+
+# 常用脉冲波形的缓存，键为(波形名, 参数..., sRate, 默认精度)，缓存的数据只读共享
+pulse_cache = LRUCache(maxsize=512)
+
+def _cached_init(key, timeFunc, domain, sRate):
+    '''从pulse_cache中取出波形数据，没有则生成；返回共享只读数据的Wavedata'''
+    key = key+(get_default_dtype(),)
+    data = pulse_cache.get(key, lambda: as_dtype(Wavedata.generateData(timeFunc,domain,sRate)))
+    return Wavedata._from_array(data, sRate)
+
+def pulse_cache_info():
+    '''返回脉冲缓存的统计信息'''
+    return pulse_cache.info()
+
+def clear_pulse_cache():
+    '''清空脉冲缓存'''
+    pulse_cache.clear()
 
 ### 重要的wd函数
+def _carrier_wd(w, phi, width, sRate):
+    '''由载波表得到复数载波Wavedata，共享只读数据'''
+    size = np.around(abs(width)*sRate).astype(int)
+    return Wavedata._from_array(carrier(w, phi, size, sRate), sRate)
+
 def Sin(w, phi=0, width=0, sRate=1e2):
-    timeFunc = lambda t: np.sin(w*t+phi)
-    domain=(0,width)
-    return Wavedata.init(timeFunc,domain,sRate)
+    '''正弦信号，为载波表的虚部'''
+    w_exp = _carrier_wd(w, phi, width, sRate)
+    return Wavedata._from_array(w_exp.data.imag, sRate)
 
 def Cos(w, phi=0, width=0, sRate=1e2):
-    timeFunc = lambda t: np.cos(w*t+phi)
-    domain=(0,width)
-    return Wavedata.init(timeFunc,domain,sRate)
+    '''余弦信号，为载波表的实部'''
+    w_exp = _carrier_wd(w, phi, width, sRate)
+    return Wavedata._from_array(w_exp.data.real, sRate)
 
 def Exp(w, phi=0, width=0, sRate=1e2):
     '''IQ类型 复数正弦信号'''
-    timeFunc = lambda t: np.exp(1j*(w*t+phi))
-    domain=(0,width)
-    return Wavedata.init(timeFunc,domain,sRate)
+    return _carrier_wd(w, phi, width, sRate)
 
 
 ### 非IQ类型
@@ -27,11 +54,18 @@ def Blank(width=0, sRate=1e2):
     '''空波形'''
     timeFunc = lambda x: 0
     domain=(0, width)
-    return Wavedata.init(timeFunc,domain,sRate)
+    return _cached_init(('Blank',width,sRate),timeFunc,domain,sRate)
 
-def Noise_wgn(width=0, sRate=1e2):
-    '''产生高斯白噪声序列，注意序列未归一化'''
+def Noise_wgn(width=0, sRate=1e2, path=None, chunk=2**20):
+    '''产生高斯白噪声序列，注意序列未归一化；
+    给定path时逐块生成并写入memmap文件，不占用整段内存'''
     size = np.around(width * sRate).astype(int)
+    if path is not None:
+        w = Wavedata.from_memmap(path, 'w+', size, sRate, as_dtype(0.0).dtype)
+        for start in range(0, size, chunk):
+            w.data[start:start+chunk] = np.random.randn(min(chunk, size-start))
+        w.data.flush()
+        return w
     data = np.random.randn(size)
     return Wavedata(data,sRate)
 
@@ -39,20 +73,20 @@ def DC(width=0, sRate=1e2):
     '''方波'''
     timeFunc = lambda x: 1
     domain=(0, width)
-    return Wavedata.init(timeFunc,domain,sRate)
+    return _cached_init(('DC',width,sRate),timeFunc,domain,sRate)
 
 def Triangle(width=1, sRate=1e2):
     '''三角波'''
     timeFunc = lambda x: 1-np.abs(2/width*x)
     domain=(-0.5*width,0.5*width)
-    return Wavedata.init(timeFunc,domain,sRate)
+    return _cached_init(('Triangle',width,sRate),timeFunc,domain,sRate)
 
 def Gaussian(width=1, sRate=1e2):
     '''高斯波形'''
     c = width/(4*np.sqrt(2*np.log(2)))
     timeFunc = lambda x: np.exp(-0.5*(x/c)**2)
     domain=(-0.5*width,0.5*width)
-    return Wavedata.init(timeFunc,domain,sRate)
+    return _cached_init(('Gaussian',width,sRate),timeFunc,domain,sRate)
 
 def Gaussian2(width=1,sRate=1e2,a=5):
     '''修正的高斯波形, a是width和方差的比值'''
@@ -61,12 +95,12 @@ def Gaussian2(width=1,sRate=1e2,a=5):
     y0 = np.exp(-0.5*(width/2/c)**2)
     timeFunc = lambda x: (np.exp(-0.5*(x/c)**2)-y0)/(1-y0)
     domain=(-0.5*width,0.5*width)
-    return Wavedata.init(timeFunc,domain,sRate)
+    return _cached_init(('Gaussian2',width,sRate,a),timeFunc,domain,sRate)
 
 def CosPulse(width=1, sRate=1e2):
     timeFunc = lambda x: (np.cos(2*np.pi/width*x)+1)/2
     domain=(-0.5*width,0.5*width)
-    return Wavedata.init(timeFunc,domain,sRate)
+    return _cached_init(('CosPulse',width,sRate),timeFunc,domain,sRate)
 
 def Sinc(width=1, sRate=1e2, a=1):
     timeFunc = lambda t: np.sinc(a*t)
@@ -0,0 +1,126 @@
+import ctypes
+import numpy as np
+import pytest
+
+
+class FakeLibrary(object):
+    '''代替ATSApi和windll，所有函数都返回0'''
+    def __getattr__(self, name):
+        func = lambda *args, **kw: 0
+        setattr(self, name, func)
+        return func
+
+
+def _import_driver():
+    '''导入驱动时用FakeLibrary代替ATSApi和windll，使测试不依赖Windows和数字化仪'''
+    CDLL, windll = ctypes.CDLL, getattr(ctypes, 'windll', None)
+    ctypes.CDLL = lambda name, *args, **kw: (
+        FakeLibrary() if 'ATSApi' in name else CDLL(name, *args, **kw))
+    if windll is None:
+        ctypes.windll = FakeLibrary()
+    try:
+        return pytest.importorskip('qulab.drivers.AlazarTechDigitizer.Driver')
+    finally:
+        ctypes.CDLL = CDLL
+        if windll is None:
+            del ctypes.windll
+
+
+AlazarDriver = _import_driver()
+
+
+class FakeDigitizer(object):
+    '''模拟数字化仪，每个缓冲填入随机码值，raw中保存填入的码值'''
+    inputRange = {1: 1.0, 2: 0.5}
+
+    def __init__(self, seed=0, bitsPerSample=8):
+        self.rng = np.random.RandomState(seed)
+        self.bitsPerSample = bitsPerSample
+        self.raw = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kw: None
+
+    def waitNextAsyncBufferComplete(self, buff, nbytes, timeout):
+        if self.bitsPerSample == 8:
+            raw = self.rng.randint(0, 256, nbytes).astype(np.uint8)
+        else:
+            raw = self.rng.randint(0, 1 << self.bitsPerSample, nbytes // 2).astype(np.uint16)
+        ctypes.memmove(buff, raw.ctypes.data, nbytes)
+        self.raw.append(raw)
+
+
+def _driver(dtype=np.float64, bits=8, **kw):
+    d = AlazarDriver.Driver()
+    d.handle = FakeDigitizer(bitsPerSample=bits)
+    d.config.update(repeats=256, recordsPerBuffer=64, n=1000,
+                    samplesPerRecord=1024, dtype=dtype)
+    d.config.update(kw)
+    return d
+
+
+def _volts(d):
+    '''由FakeDigitizer填入的码值直接换算得到的 (记录数, 采样点数) 波形'''
+    raw = np.concatenate(d.handle.raw).astype(float)
+    half = (1 << (d.handle.bitsPerSample - 1)) - 0.5
+    shape = (-1, d.config['samplesPerRecord'])
+    A = ((raw[0::2] - half) / half * d.handle.inputRange[1]).reshape(shape)
+    B = ((raw[1::2] - half) / half * d.handle.inputRange[2]).reshape(shape)
+    return A, B
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_average_dtype_matches_records(dtype):
+    d = _driver(dtype)
+    for fft in (False, True):
+        A, B = d.getData(fft, avg=False)
+        mA, mB = d.getData(fft, avg=True)
+        assert mA.dtype == A.dtype and mB.dtype == B.dtype
+        accA, _ = d.getAverage(fft, var=True)
+        assert accA.mean().dtype == A.dtype
+        assert accA.var().dtype == np.dtype(dtype)
+
+
+@pytest.mark.parametrize('bits', [8, 12])
+@pytest.mark.parametrize('workers', [0, 2])
+def test_records_are_converted_codes(bits, workers):
+    d = _driver(bits=bits, workers=workers, ringDepth=3)
+    A, B = d.getData()
+    refA, refB = _volts(d)
+    assert A.shape == (256, 1024)
+    assert np.allclose(A, refA, rtol=0, atol=1e-12)
+    assert np.allclose(B, refB, rtol=0, atol=1e-12)
+
+
+def test_results_written_into_out_and_reused():
+    d = _driver(reuse=True)
+    A, B = d.getData()
+    A2, B2 = d.getData()
+    assert A2 is A and B2 is B
+    out = (np.zeros((256, 1024)), np.zeros((256, 1024)))
+    A3, B3 = d.getData(out=out)
+    assert A3 is out[0] and B3 is out[1]
+    assert np.allclose(A3, _volts(d)[0][-256:], rtol=0, atol=1e-12)
+
+
+def test_average_matches_records():
+    d = _driver(workers=2)
+    accA, accB = d.getAverage(var=True)
+    refA, refB = _volts(d)
+    assert accA.count == 256
+    assert np.allclose(accA.mean(), refA.mean(axis=0), rtol=0, atol=1e-12)
+    assert np.allclose(accB.var(), refB.var(axis=0), rtol=0, atol=1e-12)
+
+
+def test_fft_demod_matches_kernel():
+    f_list = [k*10e6 for k in range(1, 13)]
+    res = {}
+    for demod in ('dot', 'fft'):
+        d = _driver(demod=demod)
+        d.set(f_list=f_list)
+        res[demod] = d.getData(fft=True)
+    for x, y in zip(res['dot'], res['fft']):
+        assert x.shape == (256, len(f_list))
+        assert np.allclose(x, y, rtol=0, atol=1e-12)
+    e = AlazarDriver.getExpArray(f_list, 1000)
+    assert np.allclose(res['dot'][0], _volts(d)[0][:, :1000].dot(e)/1000, rtol=0, atol=1e-12)
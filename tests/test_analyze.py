@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from qulab.tools.wavedata import Wavedata, WaveBatch
+from qulab.tools.wavedata import _Analyze as A
+
+SRATE, IF = 1e9, 50e6
+
+
+def _records(n=8, size=1000, seed=0):
+    '''有IQ失衡、直流偏置和噪声的中频记录'''
+    rng = np.random.RandomState(seed)
+    t = (np.arange(size)+0.5)/SRATE
+    amp = rng.uniform(0.5, 1.5, (n, 1))*np.exp(1j*rng.uniform(-np.pi, np.pi, (n, 1)))
+    z = amp*np.exp(2j*np.pi*IF*t)
+    I = z.real+0.02
+    Q = 0.9*np.abs(amp)*np.sin(2*np.pi*IF*t+np.angle(amp)+0.05)-0.01
+    data = I+1j*Q+0.05*(rng.randn(n, size)+1j*rng.randn(n, size))
+    return WaveBatch._from_array(data, SRATE)
+
+
+def _homodyne(batch, cali, window):
+    return np.array([A.Homodyne(Wavedata(d, SRATE), IF, cali if np.ndim(cali) < 3 else cali[i])
+                     .data[window].mean() for i, d in enumerate(batch.data)])
+
+
+def test_analyze_cali_batch_per_record():
+    batch = _records()
+    cali = A.Analyze_cali_batch(batch, IF, per_record=True)
+    ref = [A.Analyze_cali(Wavedata(d, SRATE), IF) for d in batch.data]
+    assert np.allclose(cali, ref, rtol=0, atol=1e-3)
+
+
+@pytest.mark.parametrize('kind', ['none', 'shared', 'per_record'])
+@pytest.mark.parametrize('window', [slice(None), slice(50, -50)])
+def test_homodyne_batch_matches_homodyne(kind, window):
+    batch = _records()
+    cali = {'none': None,
+            'shared': A.Analyze_cali_batch(batch, IF),
+            'per_record': A.Analyze_cali_batch(batch, IF, per_record=True)}[kind]
+    IQ = A.Homodyne_batch(batch, IF, cali, window=window, chunk=3)
+    assert IQ.shape == (batch.records,)
+    assert np.allclose(IQ, _homodyne(batch, cali, window), rtol=0, atol=1e-10)
+
+
+def test_homodyne_batch_array_input():
+    batch = _records()
+    IQ = A.Homodyne_batch(np.asarray(batch.data), IF, sRate=SRATE)
+    assert np.allclose(IQ, _homodyne(batch, None, slice(None)), rtol=0, atol=1e-12)
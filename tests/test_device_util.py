@@ -0,0 +1,61 @@
+import struct
+import numpy as np
+import pytest
+from qulab.device.util import DAC_codes, DAC_bytes, IEEE_488_2_BinBlock
+
+# 包含超出±1的点和刚好落在码值边界附近的点
+POINTS = np.r_[np.linspace(-1.2, 1.2, 1001), -1, 1, 0.5/8191, -0.5/8191, 1-1e-12]
+
+
+def _trunc(x):
+    return np.trunc(x).astype(int)
+
+
+# 各驱动中 DAC_codes 的参数，以及改用 DAC_codes 之前的码值计算方法
+DRIVERS = {
+    '33120A': (dict(scale=2047, bits=12, low=-2047),
+               lambda x: _trunc((2047*x).clip(-2047, 2047)), np.int16),
+    '33220A': (dict(scale=8191, bits=14, low=-8191),
+               lambda x: _trunc((8191*x).clip(-8191, 8191)), np.int16),
+    'AFG3102/wx_AWG': (dict(scale=8191, zero=8192, bits=14, unsigned=True, low=1),
+                       lambda x: _trunc(x.clip(-1, 1)*8191)+8192, np.uint16),
+    'Tek_AWG/Tek_5014C': (dict(scale=0x1fff, zero=0x1fff, bits=14, unsigned=True, high=0x3ffe),
+                          lambda x: _trunc(x.clip(-1, 1)*0x1fff)+0x1fff, np.uint16),
+}
+
+
+@pytest.mark.parametrize('name', sorted(DRIVERS))
+def test_DAC_codes_drivers(name):
+    kw, ref, dtype = DRIVERS[name]
+    codes = DAC_codes(POINTS, **kw)
+    assert codes.dtype == dtype
+    assert np.array_equal(codes, ref(POINTS))
+
+
+@pytest.mark.parametrize('unsigned', [False, True])
+def test_DAC_codes_AWGBoard(unsigned):
+    # AWGBoard._wave_codes：无符号时偏置1V，码值为截断取整，超出范围限幅
+    gain, offset = 0.9, 1 if unsigned else 0
+    x = POINTS[np.abs(POINTS*gain) < 1]
+    codes = DAC_codes(x, 32767.5, gain=gain, offset=offset, unsigned=unsigned)
+    a = (x*gain+offset)*32767.5
+    assert codes.dtype == (np.uint16 if unsigned else np.int16)
+    assert np.array_equal(codes, a.astype(codes.dtype))
+    lo, hi = (0, 65535) if unsigned else (-32768, 32767)
+    assert np.array_equal(DAC_codes([-2, 2], 32767.5, offset=offset, unsigned=unsigned), [lo, hi])
+
+
+def test_DAC_codes_wavedata_and_real_part():
+    class W(object):
+        data = np.array([0.5+0.5j, -0.25-1j])
+    assert np.array_equal(DAC_codes(W(), 100), [50, -25])
+
+
+@pytest.mark.parametrize('fmt', ['h', 'H', 'f', 'd'])
+@pytest.mark.parametrize('big', [False, True])
+def test_DAC_bytes_matches_struct(fmt, big):
+    values = np.arange(0, 300, 7)
+    ref = struct.pack('%s%d%s' % ('>' if big else '<', len(values), fmt), *values.tolist())
+    assert DAC_bytes(values, fmt, big) == ref
+    block, header = IEEE_488_2_BinBlock(values, dtype=fmt, is_big_endian=big)
+    assert block == header.encode()+ref
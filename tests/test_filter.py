@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+import scipy.signal as signal
+from qulab.tools.wavedata import _Filter as F
+
+FS = 1e9
+
+
+def _signal(n=4000, seed=0):
+    rng = np.random.RandomState(seed)
+    t = np.arange(n)/FS
+    return np.cos(2*np.pi*50e6*t)+0.5*np.cos(2*np.pi*80e6*t)+0.1*rng.randn(n)
+
+
+def _stagewise(filters, x):
+    for f in filters:
+        x = f.process(x, FS)[0]
+    return x
+
+
+def _average(filters, x):
+    return np.mean([f.process(x, FS)[0] for f in filters], axis=0)
+
+
+@pytest.mark.parametrize('N', [2, 4, 6])
+def test_parallel_causal_iir_matches_branch_average(N):
+    branches = [F.IIRFilter(N=N, Wn=[w-2e6, w+2e6], fs=FS, causal=True)
+                for w in (50e6, 80e6)]
+    x = _signal()
+    y = F.Parallel(*branches).process(x, FS)[0]
+    assert np.all(np.isfinite(y))
+    assert np.allclose(y, _average(branches, x), rtol=0, atol=1e-9)
+
+
+def test_parallel_zero_phase_iir_matches_branch_average():
+    branches = [F.IIRFilter(N=4, Wn=[w-2e6, w+2e6], fs=FS) for w in (50e6, 80e6)]
+    x = _signal()
+    y = F.Parallel(*branches).process(x, FS)[0]
+    assert np.allclose(y, _average(branches, x), rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('causal', [False, True])
+def test_parallel_fir_merged(causal):
+    branches = [F.FIRFilter(numtaps=n, cutoff=c, fs=FS, causal=causal)
+                for n, c in ((51, 100e6), (101, 60e6))]
+    p = F.Parallel(*branches)
+    assert p.merged is not None
+    x = _signal()
+    assert np.allclose(p.process(x, FS)[0], _average(branches, x), rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('causal', [False, True])
+def test_series_matches_stagewise(causal):
+    stages = [F.IIRFilter(N=4, Wn=[45e6, 55e6], fs=FS, causal=causal),
+              F.BesselFilter(N=2, Wn=200e6, fs=FS, causal=causal),
+              F.FIRFilter(numtaps=51, cutoff=150e6, fs=FS, causal=causal),
+              F.FIRFilter(numtaps=31, cutoff=120e6, fs=FS, causal=causal)]
+    if not causal:
+        stages.insert(2, F.baFilter('butter', N=2, Wn=120e6, fs=FS))
+    x = _signal()
+    y = F.series(*stages).process(x, FS)[0]
+    assert np.allclose(y, _stagewise(stages, x), rtol=0, atol=1e-9)
+
+
+def test_series_merges_only_causal_stages():
+    zp = [F.IIRFilter(fs=FS), F.BesselFilter(fs=FS)]
+    assert len(F.Series(*zp).stages) == 2
+    causal = [F.IIRFilter(fs=FS, causal=True), F.BesselFilter(fs=FS, causal=True)]
+    assert len(F.Series(*causal).stages) == 1
+
+
+@pytest.mark.parametrize('complex_', [False, True])
+def test_overlap_save_matches_convolve(complex_):
+    rng = np.random.RandomState(1)
+    h = rng.randn(37)
+    x = rng.randn(3, 1000)
+    if complex_:
+        x = x+1j*rng.randn(3, 1000)
+    y, zf = F.overlap_save(h, x, nfft=128)
+    ref = np.array([np.convolve(h, r)[:1000] for r in x])
+    assert np.allclose(y, ref, rtol=0, atol=1e-12)
+    assert np.array_equal(zf, x[:, -36:])
+
+
+def test_overlap_save_state_joins_blocks():
+    rng = np.random.RandomState(2)
+    h, x = rng.randn(25), rng.randn(700)
+    y1, zi = F.overlap_save(h, x[:300])
+    y2, _ = F.overlap_save(h, x[300:], zi)
+    assert np.allclose(np.r_[y1, y2], np.convolve(h, x)[:700], rtol=0, atol=1e-12)
+
+
+def _chunks(x, sizes):
+    bounds = np.cumsum([0]+list(sizes))
+    return [x[..., a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+@pytest.mark.parametrize('f', [F.IIRFilter(N=4, Wn=[45e6, 55e6], fs=FS, causal=True),
+                               F.FIRFilter(numtaps=101, cutoff=100e6, fs=FS, causal=True)])
+def test_stream_matches_one_shot(f):
+    x = np.array([_signal(seed=0), _signal(seed=1)])
+    s = f.stream()
+    y = np.concatenate([s.process(c, FS)[0] for c in _chunks(x, [1, 99, 1000, 7, 2893])],
+                       axis=-1)
+    assert np.allclose(y, f.process(x, FS)[0], rtol=0, atol=1e-10)
+    # reset后重新开始新的数据流
+    y2 = s.reset().process(x, FS)[0]
+    assert np.allclose(y2, f.process(x, FS)[0], rtol=0, atol=1e-10)
+
+
+def test_causal_sos_matches_sosfilt():
+    f = F.IIRFilter(N=4, Wn=[45e6, 55e6], fs=FS, causal=True)
+    x = _signal()
+    assert np.array_equal(f.process(x, FS)[0], signal.sosfilt(f.sos, x))
+
+
+def test_fir_zero_phase_is_centered():
+    f = F.FIRFilter(numtaps=101, cutoff=100e6, fs=FS)
+    x = _signal()
+    ref = np.convolve(x, f.h)[50:50+len(x)]
+    assert np.allclose(f.process(x, FS)[0], ref, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('f, ba', [
+    (F.IIRFilter(fs=FS), signal.iirfilter(N=2, Wn=[49e6, 51e6], rp=0.01, rs=100,
+                                          btype='band', ftype='ellip', output='ba', fs=FS)),
+    (F.BesselFilter(fs=FS), signal.bessel(N=2, Wn=100e6, btype='low', norm='phase',
+                                          output='ba', fs=FS))])
+def test_zero_phase_iir_matches_filtfilt(f, ba):
+    # 原来的IIRFilter/BesselFilter为ba形式，用filtfilt零相位滤波
+    x = _signal()
+    ref = signal.filtfilt(*ba, x)
+    assert np.allclose(f.process(x, FS)[0], ref, rtol=0, atol=1e-6*np.abs(ref).max())
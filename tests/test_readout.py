@@ -0,0 +1,66 @@
+import numpy as np
+from scipy.special import ndtr
+from qulab.tools.single_shot import ReadoutClassifier
+
+N = 200000
+
+
+def _blobs(centers, sigma, seed=0):
+    rng = np.random.RandomState(seed)
+    return [c+sigma*(rng.randn(N)+1j*rng.randn(N)) for c in centers]
+
+
+def test_two_state_fidelity():
+    # 两态中心相距2，标准差0.5，最优阈值在中点，保真度为 Phi(1/0.5)
+    centers = [1+1j, -1+1j]
+    rc = ReadoutClassifier(bins=200)
+    for state, z in enumerate(_blobs(centers, 0.5)):
+        for batch in np.split(z, 4):
+            rc.update(state, batch)
+    expected = ndtr(2)
+    assert np.allclose(rc.centers, centers, atol=5e-3)
+    assert abs(rc.axis-1) < 1e-2
+    assert abs(rc.threshold) < 0.1
+    assert abs(rc.fidelity()-expected) < 3e-3
+    assert abs(rc.visibility()-(2*expected-1)) < 6e-3
+    M = rc.assignment_matrix()
+    assert np.allclose(M.sum(axis=1), 1)
+
+
+def test_two_state_populations():
+    rc = ReadoutClassifier()
+    z0, z1 = _blobs([1, -1], 0.5)
+    rc.update(0, z0).update(1, z1)
+    mix = np.r_[z0[:3000], z1[:7000]]
+    assert np.allclose(rc.populations(mix), [0.3, 0.7], atol=0.03)
+    assert np.allclose(rc.populations(mix, correct=True), [0.3, 0.7], atol=0.01)
+
+
+def test_IQ_pair_input():
+    rc = ReadoutClassifier()
+    z0, z1 = _blobs([1, -1], 0.5)
+    rc.update(0, np.array([z0.real, z0.imag])).update(1, z1)
+    assert np.array_equal(rc.count, [N, N])
+    assert np.array_equal(rc.classify(np.array([[2, -2], [0, 0]])), [0, 1])
+
+
+def test_three_state_nearest_center():
+    # 三个态在正三角形顶点，与最近中心判别的保真度用蒙特卡洛估计
+    centers = np.exp(2j*np.pi*np.arange(3)/3)
+    blobs = _blobs(centers, 0.3)
+    rc = ReadoutClassifier(states=3, bins=200)
+    for state, z in enumerate(blobs):
+        rc.update(state, z)
+    test = _blobs(centers, 0.3, seed=1)
+    expected = np.mean([np.mean(np.abs(z[:, None]-centers).argmin(axis=1) == i)
+                        for i, z in enumerate(test)])
+    assert abs(rc.fidelity()-expected) < 3e-3
+    assert np.array_equal(rc.classify(centers), [0, 1, 2])
+
+
+def test_reset_keeps_lims():
+    rc = ReadoutClassifier(lims=(-2, 2, -2, 2))
+    rc.update(0, _blobs([1], 0.5)[0])
+    rc.reset()
+    assert rc.lims == (-2, 2, -2, 2)
+    assert rc.count.sum() == 0 and rc.hist.sum() == 0
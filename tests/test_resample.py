@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from qulab.tools.wavedata import Wavedata
+
+T = 1e-6
+
+
+def _tone(sRate, iq=False, f=20e6):
+    if iq:
+        return Wavedata.init(lambda t: np.exp(2j*np.pi*f*t), (0, T), sRate)
+    return Wavedata.init(lambda t: np.cos(2*np.pi*f*t), (0, T), sRate)
+
+
+@pytest.mark.parametrize('iq', [False, True])
+@pytest.mark.parametrize('sRate, new_sRate', [(1e9, 2.4e9), (2.4e9, 1e9), (1e9, 1.5e9)])
+def test_resample_fft_periodic_tone(sRate, new_sRate, iq):
+    # 整数个周期的单频信号，FFT带限重采样是精确的
+    w = _tone(sRate, iq).resample(new_sRate, mode='fft')
+    ref = _tone(new_sRate, iq)
+    assert w.sRate == new_sRate
+    assert w.size == ref.size
+    assert np.allclose(w.data, ref.data, rtol=0, atol=1e-10)
+
+
+@pytest.mark.parametrize('iq', [False, True])
+@pytest.mark.parametrize('sRate, new_sRate', [(1e9, 2.4e9), (2.4e9, 1e9), (1e9, 1.5e9)])
+def test_resample_poly_tone(sRate, new_sRate, iq):
+    # 多相滤波只在记录两端有边缘效应，中间部分与解析值一致
+    w = _tone(sRate, iq).resample(new_sRate, mode='poly')
+    ref = _tone(new_sRate, iq)
+    assert w.sRate == new_sRate
+    assert w.size == ref.size
+    k = ref.size//10
+    assert np.allclose(w.data[k:-k], ref.data[k:-k], rtol=0, atol=2e-3)
+
+
+def _pulse(t, f=20e6):
+    return np.exp(-((t-T/2)/100e-9)**2)*np.exp(2j*np.pi*f*t)
+
+
+@pytest.mark.parametrize('mode, atol', [('fft', 1e-10), ('fir', 1e-4)])
+def test_delay_fractional(mode, atol):
+    d = 0.37e-9
+    w = Wavedata.init(lambda t: _pulse(t).real, (0, T), 1e9)
+    ref = Wavedata.init(lambda t: _pulse(t-d).real, (0, T), 1e9)
+    res = w.delay(d, mode=mode)
+    assert res.size == w.size
+    assert np.allclose(res.data, ref.data, rtol=0, atol=atol)
+
+
+@pytest.mark.parametrize('mode, atol', [('fft', 1e-10), ('fir', 1e-4)])
+def test_delay_IQ_separately(mode, atol):
+    d, d_Q = 0.37e-9, -1.2e-9
+    w = Wavedata.init(_pulse, (0, T), 1e9)
+    ref = Wavedata.init(lambda t: _pulse(t-d).real+1j*_pulse(t-d_Q).imag, (0, T), 1e9)
+    assert np.allclose(w.delay(d, d_Q, mode=mode).data, ref.data, rtol=0, atol=atol)
+
+
+def test_delay_integer_is_shift():
+    w = Wavedata.init(lambda t: _pulse(t).real, (0, T), 1e9)
+    assert np.allclose(w.delay(3e-9).data, np.r_[0, 0, 0, w.data[:-3]], rtol=0, atol=1e-12)
@@ -0,0 +1,66 @@
+import pickle
+import numpy as np
+from qulab.tools.wavedata import Wavedata
+
+
+def test_pickle_baseline_format():
+    # 旧版本的Wavedata直接把数据保存在实例的'data'属性中
+    old = Wavedata.__new__(Wavedata)
+    old.__dict__.update({'data': np.arange(5.0), 'sRate': 10})
+    assert 'data' in old.__dict__
+    w = pickle.loads(pickle.dumps(old))
+    assert w.size == 5
+    assert w.sRate == 10
+    assert np.array_equal(w.data, np.arange(5.0))
+    assert np.array_equal((w+w).data, 2*np.arange(5.0))
+
+
+def test_pickle_round_trip():
+    w = Wavedata(np.linspace(0, 1, 11), 1e9)
+    w2 = pickle.loads(pickle.dumps(w))
+    assert w2.sRate == w.sRate
+    assert np.array_equal(w2.data, w.data)
+
+
+def _exprs(w, v):
+    return [2*w+1, w*2.5-v, -w/3, abs(w)**2, 1/(w+2), (w+v)*0.5, w*1j]
+
+
+def test_lazy_dtype_matches_eager():
+    from qulab.tools.wavedata import lazy
+    for dtype in (np.float32, np.float64, np.complex64):
+        w = Wavedata(np.linspace(0.1, 1, 16), 1e9, dtype)
+        v = Wavedata(np.linspace(1, 2, 16), 1e9)
+        eager = _exprs(w, v)
+        with lazy():
+            lazy_res = _exprs(w, v)
+        for a, b in zip(eager, lazy_res):
+            assert b.dtype == a.dtype
+            assert b.data.dtype == a.data.dtype
+            assert np.allclose(a.data, b.data, atol=1e-6)
+
+
+def test_wave_sequence_matches_or_xor():
+    from qulab.tools.wavedata import WaveSequence, Gaussian, CosPulse, Blank, Exp
+    sRate = 2e9
+    g, c = Gaussian(20e-9, sRate), CosPulse(10e-9, sRate)
+    e = Exp(2*np.pi*100e6, 0.3, 15e-9, sRate)
+    ref = ((g|Blank(5e-9, sRate)|c|e)^3)|g
+    seq = WaveSequence(sRate)
+    seq = (seq|g).blank(5e-9)|c|e
+    seq = (seq^3)|g
+    w = seq.to_wavedata()
+    assert seq.size == ref.size
+    assert w.sRate == sRate
+    assert w.data.dtype == ref.data.dtype
+    assert np.array_equal(w.data, ref.data)
+
+
+def test_wave_sequence_place_adds_overlap():
+    from qulab.tools.wavedata import WaveSequence
+    a = Wavedata(np.ones(10), 1e9)
+    b = Wavedata(np.arange(4.0), 1e9)
+    w = WaveSequence(1e9).append(a).place(b, 8e-9).to_wavedata()
+    ref = np.r_[np.ones(10), 0, 0]
+    ref[8:12] += np.arange(4.0)
+    assert np.array_equal(w.data, ref)